@@ -8,12 +8,16 @@ from cpnpy.cpn.cpn_imp import *
 
 
 class StateSpaceAnalyzer:
-    def __init__(self, cpn, marking, context=None):
+    def __init__(self, cpn, marking, context=None, **exploration_options):
         """
         Initialize the analyzer with the given CPN.
         The constructor will:
           - Build the reachability graph (RG) from the CPN's initial marking and context.
           - Build the SCC graph (SG) from the RG.
+
+        exploration_options are passed to build_reachability_graph, e.g. max_states, max_depth, time_budget,
+        max_memory or order. If a limit stops the exploration, the RG is partial (self.complete is False): the
+        properties that need the whole state space are then reported as "inconclusive" by summarize.
         """
         if context is None:
             context = EvaluationContext(user_code="")
@@ -23,7 +27,8 @@ class StateSpaceAnalyzer:
         self.context = context
 
         # Compute the reachability graph
-        self.RG = build_reachability_graph(self.cpn, self.marking, self.context)
+        self.RG = build_reachability_graph(self.cpn, self.marking, self.context, **exploration_options)
+        self.complete = self.RG.graph["complete"]
         # Compute the SCC graph
         self.SG = build_scc_graph(self.RG)
 
@@ -40,10 +45,9 @@ class StateSpaceAnalyzer:
         for node in self.RG.nodes():
             marking = self.RG.nodes[node]['marking']
             enabled = []
-            # Find all enabled transitions by checking for any valid binding
+            # Find all enabled transitions: a single valid binding is enough
             for t in self.cpn.transitions:
-                bindings = self.cpn._find_all_bindings(t, marking, self.context)
-                if bindings:
+                if self.cpn._find_binding(t, marking, self.context) is not None:
                     enabled.append(t.name)
             self.marking_to_enabled_transitions[node] = enabled
 
@@ -59,7 +63,10 @@ class StateSpaceAnalyzer:
             "RG_nodes": self.RG.number_of_nodes(),
             "RG_arcs": self.RG.number_of_edges(),
             "SCC_nodes": self.SG.number_of_nodes(),
-            "SCC_arcs": self.SG.number_of_edges()
+            "SCC_arcs": self.SG.number_of_edges(),
+            "complete": self.complete,
+            "termination": self.RG.graph["termination"],
+            "frontier_size": len(self.RG.graph["frontier"])
         }
         end = time.time()
         stats["computation_time"] = end - start
@@ -91,7 +98,7 @@ class StateSpaceAnalyzer:
         for node in self.RG.nodes():
             marking = self.RG.nodes[node]['marking']
             for p in place_names:
-                count = len(marking.get_multiset(p).tokens)
+                count = len(marking.get_multiset(p))
                 if count < place_min[p]:
                     place_min[p] = count
                 if count > place_max[p]:
@@ -118,8 +125,8 @@ class StateSpaceAnalyzer:
             for p in place_names:
                 ms = marking.get_multiset(p)
                 val_counts = {}
-                for tok in ms.tokens:
-                    val_counts[tok.value] = val_counts.get(tok.value, 0) + 1
+                for value, timestamps in ms.items():
+                    val_counts[value] = len(timestamps)
 
                 # Update token_stats
                 for val, c in val_counts.items():
@@ -163,8 +170,16 @@ class StateSpaceAnalyzer:
     # Liveness
     # --------------------------------------------------------------------------
     def list_dead_markings(self) -> List[Any]:
-        """Markings with no enabled transitions."""
-        return [node for node, ets in self.marking_to_enabled_transitions.items() if not ets]
+        """
+        Markings with no enabled transitions. On a partial RG, the unexplored markings (see
+        list_unexplored_markings) are left out: whether they are dead is not known.
+        """
+        unexplored = set(self.RG.graph["frontier"])
+        return [node for node, ets in self.marking_to_enabled_transitions.items() if not ets and node not in unexplored]
+
+    def list_unexplored_markings(self) -> List[Any]:
+        """Markings whose successors were not (all) explored because a limit stopped the exploration."""
+        return list(self.RG.graph["frontier"])
 
     def list_dead_transitions(self) -> List[str]:
         """Transitions that are never enabled."""
@@ -219,19 +234,29 @@ class StateSpaceAnalyzer:
     def summarize(self) -> Dict[str, Any]:
         """
         Produce a summary report of various properties.
+
+        On a partial RG (see the constructor), status is "inconclusive": the dead markings are those found among
+        the expanded markings (the unexplored ones are listed apart, under unexplored_markings), the place bounds
+        are those of the explored markings only, while the dead, live and impartial transitions and the home
+        markings, which depend on the whole state space, are "inconclusive".
         """
         stats = self.get_statistics()
         place_bounds = self.get_place_bounds()
         dead_markings = self.list_dead_markings()
-        dead_transitions = self.list_dead_transitions()
-        live_transitions = self.list_live_transitions()
-        impartial_transitions = self.list_impartial_transitions()
-        home_markings = self.list_home_markings()
+        if self.complete:
+            dead_transitions = self.list_dead_transitions()
+            live_transitions = self.list_live_transitions()
+            impartial_transitions = self.list_impartial_transitions()
+            home_markings = self.list_home_markings()
+        else:
+            dead_transitions = live_transitions = impartial_transitions = home_markings = "inconclusive"
 
         return {
+            "status": "complete" if self.complete else "inconclusive",
             "statistics": stats,
             "place_bounds": place_bounds,
             "dead_markings": dead_markings,
+            "unexplored_markings": self.list_unexplored_markings(),
             "dead_transitions": dead_transitions,
             "live_transitions": live_transitions,
             "impartial_transitions": impartial_transitions,
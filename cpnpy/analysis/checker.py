@@ -0,0 +1,134 @@
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cpnpy.analysis.reachability import _explore, equiv_binding, make_hashable
+from cpnpy.analysis.state_store import StateStore
+from cpnpy.cpn.cpn_imp import *
+
+
+class CheckResult:
+    """
+    Outcome of an on-the-fly search for a marking with a given property (a counterexample to a safety check).
+
+    found: whether such a marking is reachable. If it is, witness is the shortest path found to it, as a list of
+    (transition, binding) edge labels from the initial marking, and markings holds the markings along that path
+    (the initial marking first, the counterexample last). If not, complete tells whether the whole state space
+    was explored, i.e. whether the absence is proven; otherwise a limit stopped the search (see termination).
+    """
+    __slots__ = ("property", "found", "complete", "termination", "states_explored", "witness", "markings")
+
+    def __init__(self, property: str, found: bool, complete: bool, termination: str, states_explored: int,
+                 witness: Optional[List[Tuple[Any, Any]]] = None, markings: Optional[List[Marking]] = None):
+        self.property = property
+        self.found = found
+        self.complete = complete
+        self.termination = termination
+        self.states_explored = states_explored
+        self.witness = witness
+        self.markings = markings
+
+    @property
+    def verdict(self) -> str:
+        """
+        Verdict of the safety check "no reachable marking has the property": "violated" (a counterexample was
+        found), "holds" (the whole state space was explored, even if limits were given) or "inconclusive".
+        """
+        if self.found:
+            return "violated"
+        return "holds" if self.complete else "inconclusive"
+
+    @property
+    def counterexample(self) -> Optional[Marking]:
+        return self.markings[-1] if self.markings else None
+
+    def __repr__(self):
+        length = f", witness of {len(self.witness)} steps" if self.found else ""
+        return f"CheckResult({self.property}: {self.verdict}, {self.states_explored} states{length})"
+
+
+class OnTheFlyChecker:
+    """
+    Checks properties of a CPN while its state space is generated, with the successor generator of
+    build_reachability_graph: the search stops at the first marking with the property, whose witness path is
+    returned, instead of building the whole reachability graph first.
+
+    States are kept in a StateStore, together with the edge by which each one was first reached. The search is
+    breadth-first by default, so that witnesses are shortest; exploration_options are the limits and order options
+    of build_reachability_graph (max_states, max_depth, time_budget, max_memory, order, seed).
+    """
+
+    def __init__(self, cpn: CPN, initial_marking: Marking, context: Optional[EvaluationContext] = None,
+                 binding_equiv_func: Callable[[Dict[str, Any]], Any] = equiv_binding, semantics: str = "interleaving",
+                 **exploration_options):
+        if context is None:
+            context = EvaluationContext(user_code="")
+        self.cpn = cpn
+        self.initial_marking = initial_marking
+        self.context = context
+        self.binding_equiv_func = binding_equiv_func
+        self.semantics = semantics
+        self.options = {"max_states": None, "max_depth": None, "time_budget": None, "max_memory": None,
+                        "order": "bfs", "seed": None}
+        unknown = set(exploration_options) - set(self.options)
+        if unknown:
+            raise TypeError(f"Unknown exploration options: {sorted(unknown)}")
+        self.options.update(exploration_options)
+
+    def _search(self, property: str, predicate: Optional[Callable[[Marking], bool]] = None,
+                dead: bool = False) -> CheckResult:
+        store = StateStore(value_key=make_hashable)
+        # State id -> (id of the state it was first reached from, index of the edge label); -1 for the initial one
+        parents = array("q", [-1])
+        label_ids = array("q", [-1])
+        labels: List[Tuple[Any, Any]] = []
+        found: List[int] = []
+
+        def add_edge(source, target, transition, binding):
+            if target == len(parents):
+                parents.append(source)
+                label_ids.append(len(labels))
+                labels.append((transition, binding))
+
+        def on_new_state(node, marking):
+            if predicate(marking):
+                found.append(node)
+                return True
+            return False
+
+        def on_expanded(node, n_successors):
+            if n_successors == 0:
+                found.append(node)
+                return True
+            return False
+
+        termination, _ = _explore(self.cpn, self.initial_marking, self.context, store.add, store.__contains__,
+                                  store.decode, add_edge, self.semantics, self.binding_equiv_func,
+                                  on_new_state=on_new_state if predicate is not None else None,
+                                  on_expanded=on_expanded if dead else None, **self.options)
+        if not found:
+            return CheckResult(property, False, termination == "complete", termination, len(store))
+
+        path = []
+        node = found[0]
+        while node > 0:
+            path.append(node)
+            node = parents[node]
+        path.append(0)
+        path.reverse()
+        witness = [labels[label_ids[node]] for node in path[1:]]
+        return CheckResult(property, True, False, termination, len(store), witness,
+                           [store.decode(node) for node in path])
+
+    def find_dead_marking(self) -> CheckResult:
+        """Search for a reachable marking with no successor, even after advancing the global clock."""
+        return self._search("dead marking", dead=True)
+
+    def find_bound_violation(self, place_name: str, bound: int) -> CheckResult:
+        """Search for a reachable marking with more than bound tokens in the given place."""
+        return self._search(f"{place_name} > {bound} tokens",
+                            predicate=lambda marking: len(marking.get_multiset(place_name)) > bound)
+
+    def find_marking(self, predicate: Callable[[Marking], bool], name: str = "predicate") -> CheckResult:
+        """Search for a reachable marking satisfying predicate(marking)."""
+        return self._search(name, predicate=predicate)
+
@@ -0,0 +1,316 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import time
+import traceback
+from array import array
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import networkx as nx
+
+from cpnpy.analysis.reachability import (_current_memory, equiv_binding, equiv_marking_to_key, iter_successors,
+                                         make_hashable)
+from cpnpy.analysis.state_store import StateStore
+from cpnpy.cpn.cpn_imp import *
+
+
+def partition_of(marking: Marking, n_partitions: int) -> int:
+    """
+    Partition owning a marking: a stable hash (BLAKE2b of the repr of its equiv_marking_to_key key, so that
+    every process agrees on it) modulo n_partitions.
+    """
+    digest = hashlib.blake2b(repr(equiv_marking_to_key(marking)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % n_partitions
+
+
+# -----------------------------------------------------------------------------------
+# Workers
+# -----------------------------------------------------------------------------------
+class _Partition:
+    """
+    States owned by one worker: a StateStore of the markings (global id = local id * n_workers + index), the
+    edges leading to them, the queue of the states still to be expanded with their depth, the states left
+    unexpanded because of max_depth and the incoming items held back by the quota of new states.
+    """
+
+    def __init__(self, index: int, n_workers: int):
+        self.index = index
+        self.n_workers = n_workers
+        self.store = StateStore(value_key=make_hashable)
+        self.queue = deque()
+        self.too_deep: List[int] = []
+        self.overflow: List[Tuple[Optional[int], Any, Any, Marking, int]] = []
+        # Edges: global ids of source and target, transition and binding labels
+        self.sources = array("q")
+        self.targets = array("q")
+        self.labels: List[Tuple[Any, Any]] = []
+
+    def receive(self, items: List[Tuple[Optional[int], Any, Any, Marking, int]], quota: Optional[int]):
+        """
+        Add incoming (source id or None, transition, binding, marking, depth) items: new states are queued.
+        At most quota new states are added (None: no limit); the items that would add more are kept in
+        overflow, to be offered again with the next quota.
+        """
+        added = 0
+        for item in items:
+            source, transition, binding, marking, depth = item
+            if quota is not None and added >= quota and source is not None and self.store.lookup(marking) is None:
+                self.overflow.append(item)
+                continue
+            local_id, is_new = self.store.add(marking)
+            target = local_id * self.n_workers + self.index
+            if is_new:
+                added += 1
+                self.queue.append((local_id, depth))
+            if source is not None:
+                self.sources.append(source)
+                self.targets.append(target)
+                self.labels.append((transition, binding))
+
+    def expand(self, cpn: CPN, context: EvaluationContext, options: Dict[str, Any]) -> List[List[Any]]:
+        """Expand up to batch_size queued states; returns the successors to send, grouped by owner."""
+        outgoing: List[List[Any]] = [[] for _ in range(self.n_workers)]
+        max_depth = options["max_depth"]
+        for _ in range(min(options["batch_size"], len(self.queue))):
+            local_id, depth = self.queue.popleft()
+            source = local_id * self.n_workers + self.index
+            if max_depth is not None and depth >= max_depth:
+                self.too_deep.append(source)
+                continue
+            for transition, binding, successor in iter_successors(cpn, self.store.decode(local_id), context,
+                                                                  options["semantics"],
+                                                                  options["binding_equiv_func"]):
+                outgoing[partition_of(successor, self.n_workers)].append(
+                    (source, transition, binding, successor, depth + 1))
+        return outgoing
+
+    def frontier(self) -> List[int]:
+        """Global ids of the states whose successors were not (all) explored."""
+        partial = {item[0] for item in self.overflow}
+        return (self.too_deep + [local_id * self.n_workers + self.index for local_id, _ in self.queue]
+                + sorted(partial))
+
+
+def _worker_main(conn, index: int, n_workers: int, cpn: CPN, context: EvaluationContext, options: Dict[str, Any]):
+    """
+    Exchange loop of a worker. Every round, the coordinator sends the batches addressed to this worker (pickled
+    lists of items, forwarded as they are), the quota of new states it may add and whether the round is the last
+    one. The worker merges the held-back items and the batches, then, unless it is the last round, expands a batch
+    of its queue and answers with its outgoing batches (one pickled list per owner, None when empty), their
+    numbers of items and its counters (queued, held back and unexpanded states, states, resident memory).
+    After the last round, the worker sends its states, edges and frontier.
+    """
+    try:
+        context.compile_net(cpn)
+        partition = _Partition(index, n_workers)
+        while True:
+            batches, quota, last = conn.recv()
+            items = partition.overflow
+            partition.overflow = []
+            for data in batches:
+                items.extend(pickle.loads(data))
+            partition.receive(items, quota)
+            if last:
+                break
+            outgoing = partition.expand(cpn, context, options)
+            conn.send(([pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL) if batch else None
+                        for batch in outgoing], [len(batch) for batch in outgoing],
+                       (len(partition.queue), len(partition.overflow), len(partition.too_deep),
+                        len(partition.store), _current_memory() if options["max_memory"] is not None else 0)))
+        store = partition.store
+        conn.send(([store.decode(local_id) for local_id in range(len(store))],
+                   partition.sources.tobytes(), partition.targets.tobytes(), partition.labels,
+                   partition.frontier()))
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def _share(available: int, demands: List[int]) -> List[int]:
+    """Split available new states between the workers, evenly up to their demands."""
+    quotas = [0] * len(demands)
+    hungry = [w for w, demand in enumerate(demands) if demand > 0]
+    while available > 0 and hungry:
+        share = max(available // len(hungry), 1)
+        for w in list(hungry):
+            given = min(share, demands[w] - quotas[w], available)
+            quotas[w] += given
+            available -= given
+            if quotas[w] == demands[w]:
+                hungry.remove(w)
+            if not available:
+                break
+    return quotas
+
+
+# -----------------------------------------------------------------------------------
+# Coordinator
+# -----------------------------------------------------------------------------------
+def build_reachability_graph_parallel(
+        cpn: CPN,
+        initial_marking: Marking,
+        context: EvaluationContext,
+        n_workers: Optional[int] = None,
+        batch_size: int = 1000,
+        binding_equiv_func: Callable[[Dict[str, Any]], Any] = equiv_binding,
+        semantics: str = "interleaving",
+        output: str = "graph",
+        mp_context: Optional[str] = None,
+        max_states: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        max_memory: Optional[int] = None
+) -> Union[nx.DiGraph, StateStore]:
+    """
+    Build the reachability graph with n_workers processes (default: the number of CPUs).
+
+    The states are partitioned by a stable hash of their canonical key (partition_of): every worker owns one
+    partition, deduplicates the states sent to it and expands them with its own successor generator
+    (iter_successors) over a copy of the net and of the context. Successors are exchanged in batches: every
+    round, each worker expands at most batch_size queued states and returns the successors grouped by owner,
+    which the coordinator forwards without unpickling them. Exploration ends when no worker has queued states
+    and no batch is in flight.
+
+    The limits are those of build_reachability_graph, checked between rounds: max_states (the coordinator hands
+    out quotas of new states, so that the workers never store more), max_depth, time_budget and max_memory
+    (the resident memory of the coordinator and of all the workers). The search order is roughly breadth-first.
+
+    The partitions are merged at the end into a graph like the one of build_reachability_graph (output="graph")
+    or into a StateStore (output="store"), where the initial marking is state 0, with the same termination,
+    complete and frontier attributes. The net and the context must be picklable (the context is rebuilt in every
+    worker from its user code); mp_context selects the multiprocessing start method.
+    """
+    if semantics not in ("interleaving", "step"):
+        raise ValueError(f"Unknown semantics: {semantics}")
+    if output not in ("graph", "store"):
+        raise ValueError(f"Unknown output: {output}")
+    n_workers = n_workers or os.cpu_count() or 1
+    options = {"batch_size": batch_size, "semantics": semantics, "binding_equiv_func": binding_equiv_func,
+               "max_depth": max_depth, "max_memory": max_memory}
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    if max_memory is not None:
+        _current_memory()
+
+    ctx = multiprocessing.get_context(mp_context)
+    connections = []
+    processes = []
+    for index in range(n_workers):
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=_worker_main, args=(child_conn, index, n_workers, cpn, context, options),
+                              daemon=True)
+        process.start()
+        child_conn.close()
+        connections.append(parent_conn)
+        processes.append(process)
+
+    def receive(conn):
+        message = conn.recv()
+        if isinstance(message, tuple) and len(message) == 2 and message[0] == "error":
+            raise RuntimeError(f"Exploration worker failed:\n{message[1]}")
+        return message
+
+    try:
+        inboxes: List[List[bytes]] = [[] for _ in range(n_workers)]
+        inboxes[partition_of(initial_marking, n_workers)].append(
+            pickle.dumps([(None, None, None, initial_marking, 0)], protocol=pickle.HIGHEST_PROTOCOL))
+        # Items on their way to each worker, items held back by each worker, states stored by the workers
+        incoming = [0] * n_workers
+        held_back = [0] * n_workers
+        n_states = 0
+        termination = None
+        while termination is None:
+            if deadline is not None and time.monotonic() > deadline:
+                termination = "time_budget"
+                break
+            if max_states is not None:
+                quotas = _share(max_states - n_states, [h + i for h, i in zip(held_back, incoming)])
+            else:
+                quotas = [None] * n_workers
+            for conn, inbox, quota in zip(connections, inboxes, quotas):
+                conn.send((inbox, quota, False))
+            inboxes = [[] for _ in range(n_workers)]
+            incoming = [0] * n_workers
+            pending = False
+            too_deep = False
+            n_states = 0
+            memory = _current_memory() if max_memory is not None else 0
+            for index, conn in enumerate(connections):
+                outgoing, counts, (queued, held_back[index], n_deep, stored, used) = receive(conn)
+                pending = pending or queued > 0 or held_back[index] > 0
+                too_deep = too_deep or n_deep > 0
+                n_states += stored
+                memory += used
+                for owner, data in enumerate(outgoing):
+                    if data is not None:
+                        inboxes[owner].append(data)
+                        incoming[owner] += counts[owner]
+                        pending = True
+            if max_states is not None and n_states >= max_states and any(held_back):
+                termination = "max_states"
+            elif not pending:
+                termination = "max_depth" if too_deep else "complete"
+            elif max_memory is not None and memory > max_memory:
+                termination = "max_memory"
+
+        # Last round: the batches in flight are merged (only into known states when max_states was reached), so
+        # that the states they come from count as expanded or stay on the frontier
+        last_quota = 0 if termination == "max_states" else None
+        for conn, inbox in zip(connections, inboxes):
+            conn.send((inbox, last_quota, True))
+        partitions = [receive(conn) for conn in connections]
+    finally:
+        for conn in connections:
+            conn.close()
+        for process in processes:
+            process.join()
+
+    return _merge_partitions(partitions, initial_marking, n_workers, output, termination)
+
+
+def _merge_partitions(partitions: List[Tuple[List[Marking], bytes, bytes, List[Tuple[Any, Any]], List[int]]],
+                      initial_marking: Marking, n_workers: int, output: str,
+                      termination: str) -> Union[nx.DiGraph, StateStore]:
+    # Global id -> marking, in the order of the local ids (so roughly breadth-first)
+    markings: Dict[int, Marking] = {}
+    for index, (local_markings, _, _, _, _) in enumerate(partitions):
+        for local_id, marking in enumerate(local_markings):
+            markings[local_id * n_workers + index] = marking
+    init_id = partition_of(initial_marking, n_workers)
+
+    if output == "store":
+        store = StateStore(value_key=make_hashable)
+        ids = {init_id: store.add(markings[init_id])[0]}
+        for gid in sorted(markings):
+            if gid != init_id:
+                ids[gid] = store.add(markings[gid])[0]
+    else:
+        RG = nx.DiGraph()
+        ids = {}
+        for gid in [init_id] + sorted(gid for gid in markings if gid != init_id):
+            key = equiv_marking_to_key(markings[gid])
+            RG.add_node(key, marking=markings[gid])
+            ids[gid] = key
+
+    frontier = []
+    for _, sources_data, targets_data, labels, partition_frontier in partitions:
+        sources = array("q")
+        sources.frombytes(sources_data)
+        targets = array("q")
+        targets.frombytes(targets_data)
+        for source, target, (transition, binding) in zip(sources, targets, labels):
+            if output == "store":
+                store.add_edge(ids[source], ids[target], transition, binding)
+            else:
+                RG.add_edge(ids[source], ids[target], transition=transition, binding=binding)
+        frontier.extend(ids[gid] for gid in partition_frontier)
+    # A state partially expanded can be held back by several workers
+    frontier = list(dict.fromkeys(frontier))
+
+    if output == "store":
+        store.termination, store.complete, store.frontier = termination, termination == "complete", frontier
+        return store
+    RG.graph.update(termination=termination, complete=termination == "complete", frontier=frontier)
+    return RG
@@ -1,6 +1,12 @@
+import copy
+import itertools
+import os
+import time
 import networkx as nx
-from typing import Tuple, Set, Callable, Any, Dict
+import numpy as np
+from typing import Tuple, Callable, Any, Dict, Iterator, List, Optional
 from collections import deque
+from cpnpy.analysis.state_store import StateStore
 from cpnpy.cpn.cpn_imp import *
 
 
@@ -28,7 +34,7 @@ def equiv_marking_to_key(marking: Marking) -> Tuple[int, Tuple[Tuple[str, Tuple[
     for place_name, ms in sorted(marking._marking.items(), key=lambda x: x[0]):
         # Convert tokens to a sorted tuple of (value, timestamp), ensuring both are hashable
         token_list = tuple(
-            sorted((make_hashable(t.value), make_hashable(t.timestamp)) for t in ms.tokens)
+            sorted((make_hashable(value), make_hashable(ts)) for value, timestamps in ms.items() for ts in timestamps)
         )
         place_entries.append((place_name, token_list))
     return (marking.global_clock, tuple(place_entries))
@@ -49,72 +55,278 @@ def copy_marking(original: Marking) -> Marking:
     new_marking = Marking()
     new_marking.global_clock = original.global_clock
     for place_name, ms in original._marking.items():
-        tokens_copy = [Token(t.value, t.timestamp) for t in ms.tokens]
-        new_marking._marking[place_name] = Multiset(tokens_copy)
+        new_marking._marking[place_name] = copy.copy(ms)
     return new_marking
 
 
+def iter_enabled_bindings(cpn: CPN, marking: Marking, context: EvaluationContext) -> Iterator[Tuple[Transition, Dict[str, Any]]]:
+    """
+    Lazily yield every enabled (transition, binding) pair of the marking, transition by transition.
+    """
+    for t in cpn.transitions:
+        for binding in cpn.iter_bindings(t, marking, context):
+            yield t, binding
+
+
+def iter_maximal_steps(cpn: CPN, marking: Marking, context: EvaluationContext,
+                       binding_equiv_func: Callable[[Dict[str, Any]], Any] = equiv_binding
+                       ) -> Iterator[Tuple[Tuple[Transition, ...], List[Tuple[Transition, Dict[str, Any]]]]]:
+    """
+    Lazily yield the distinct maximal steps of the marking, as (transitions, step) pairs: one greedy maximal
+    step is seeded from every enabled binding element.
+    """
+    seen = set()
+    for t, binding in iter_enabled_bindings(cpn, marking, context):
+        step = cpn.find_step(marking, context, seeds=[(t, binding)])
+        step_key = tuple(sorted((u.name, repr(binding_equiv_func(b))) for u, b in step))
+        if step_key not in seen:
+            seen.add(step_key)
+            yield tuple(u for u, _ in step), step
+
+
+def iter_successors(cpn: CPN, marking: Marking, context: EvaluationContext, semantics: str = "interleaving",
+                    binding_equiv_func: Callable[[Dict[str, Any]], Any] = equiv_binding
+                    ) -> Iterator[Tuple[Any, Any, Marking]]:
+    """
+    Lazily yield the successors of the marking, as (transition, binding, successor marking) triples, where
+    transition and binding are the edge labels of the reachability graph (see build_reachability_graph).
+
+    If no binding element is enabled, the global clock of the marking is advanced in place to the next token
+    timestamp first. The context must have compiled the net (context.compile_net).
+    """
+    # Enabled (transition, binding) pairs are generated lazily, one successor at a time
+    enabled_transitions = iter_enabled_bindings(cpn, marking, context)
+    first = next(enabled_transitions, None)
+
+    # If no transitions are enabled, attempt to advance the global clock
+    if first is None:
+        old_clock = marking.global_clock
+        cpn.advance_global_clock(marking)
+        if marking.global_clock > old_clock:
+            # Check if transitions are now enabled
+            enabled_transitions = iter_enabled_bindings(cpn, marking, context)
+            first = next(enabled_transitions, None)
+    if first is None:
+        return
+
+    if semantics == "step":
+        for trans, step in iter_maximal_steps(cpn, marking, context, binding_equiv_func):
+            successor_marking = copy_marking(marking)
+            cpn.fire_step(step, successor_marking, context)
+            yield tuple(t.name for t in trans), tuple(binding_equiv_func(b) for _, b in step), successor_marking
+    else:
+        for trans, binding in itertools.chain([first], enabled_transitions):
+            successor_marking = copy_marking(marking)
+            cpn.fire_transition(trans, successor_marking, context, binding)
+            yield trans.name, binding_equiv_func(binding), successor_marking
+
+
+# -----------------------------------------------------------------------------------
+# Exploration
+# -----------------------------------------------------------------------------------
+SEARCH_ORDERS = ("bfs", "dfs", "random")
+
+
+class _Frontier:
+    """
+    States waiting to be expanded, as (node, depth) pairs, served in breadth-first (queue), depth-first (stack)
+    or random (a pending state drawn uniformly, like a random walk that may jump back) order.
+    """
+
+    def __init__(self, order: str, seed: Any = None):
+        self.order = order
+        self.items = deque() if order == "bfs" else []
+        self.rng = np.random.default_rng(seed) if order == "random" else None
+
+    def push(self, item: Tuple[Any, int]):
+        self.items.append(item)
+
+    def pop(self) -> Tuple[Any, int]:
+        if self.order == "bfs":
+            return self.items.popleft()
+        if self.order == "random":
+            pos = int(self.rng.integers(len(self.items)))
+            self.items[pos], self.items[-1] = self.items[-1], self.items[pos]
+        return self.items.pop()
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _current_memory() -> int:
+    """
+    Current resident set size of the process, in bytes: read from /proc/self/statm on Linux, else through psutil
+    when it is installed.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError as e:
+        raise ValueError("max_memory requires /proc/self/statm (Linux) or psutil (pip install psutil).") from e
+    return psutil.Process().memory_info().rss
+
+
+def _explore(cpn: CPN, initial_marking: Marking, context: EvaluationContext,
+             add_state: Callable[[Marking], Tuple[Any, bool]], contains: Callable[[Marking], bool],
+             marking_of: Callable[[Any], Marking], add_edge: Callable[[Any, Any, Any, Any], None],
+             semantics: str, binding_equiv_func: Callable[[Dict[str, Any]], Any],
+             max_states: Optional[int], max_depth: Optional[int], time_budget: Optional[float],
+             max_memory: Optional[int], order: str, seed: Any,
+             on_new_state: Optional[Callable[[Any, Marking], bool]] = None,
+             on_expanded: Optional[Callable[[Any, int], bool]] = None) -> Tuple[str, List[Any]]:
+    """
+    Exploration loop shared by build_reachability_graph, build_state_store and the on-the-fly checker, over
+    callbacks adding a state (returning its node and whether it is new), testing whether a marking is known,
+    giving back the marking of a node and adding an edge.
+    The optional hooks on_new_state(node, marking), called on every new state once its edge is added, and
+    on_expanded(node, number of successors), called once all the successors of a state are explored, stop the
+    exploration by returning True.
+    Returns the termination reason ("complete", "found" when a hook stopped it, "max_states", "max_depth",
+    "time_budget" or "max_memory") and the frontier: the nodes whose successors were not (all) explored.
+    """
+    if semantics not in ("interleaving", "step"):
+        raise ValueError(f"Unknown semantics: {semantics}")
+    if order not in SEARCH_ORDERS:
+        raise ValueError(f"Unknown search order: {order}")
+    context.compile_net(cpn)
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    if max_memory is not None:
+        _current_memory()
+
+    init_marking = copy_marking(initial_marking)
+    init_node, _ = add_state(init_marking)
+    n_states = 1
+    frontier = _Frontier(order, seed)
+    frontier.push((init_node, 0))
+    # States left unexpanded because of max_depth
+    too_deep: List[Any] = []
+    termination = "found" if on_new_state is not None and on_new_state(init_node, init_marking) else None
+
+    while frontier and termination is None:
+        if deadline is not None and time.monotonic() > deadline:
+            termination = "time_budget"
+            break
+        if max_memory is not None and _current_memory() > max_memory:
+            termination = "max_memory"
+            break
+        current_node, depth = frontier.pop()
+        if max_depth is not None and depth >= max_depth:
+            too_deep.append(current_node)
+            continue
+
+        n_successors = 0
+        for transition, binding, successor_marking in iter_successors(cpn, marking_of(current_node), context,
+                                                                      semantics, binding_equiv_func):
+            if max_states is not None and n_states >= max_states and not contains(successor_marking):
+                # The current state is only partially expanded: it stays on the frontier
+                frontier.push((current_node, depth))
+                termination = "max_states"
+                break
+            succ_node, is_new = add_state(successor_marking)
+            n_successors += 1
+            if is_new:
+                n_states += 1
+                frontier.push((succ_node, depth + 1))
+            add_edge(current_node, succ_node, transition, binding)
+            if is_new and on_new_state is not None and on_new_state(succ_node, successor_marking):
+                termination = "found"
+                break
+        else:
+            if on_expanded is not None and on_expanded(current_node, n_successors):
+                termination = "found"
+
+    if termination is None:
+        termination = "max_depth" if too_deep else "complete"
+    return termination, too_deep + [node for node, _ in frontier.items]
+
+
 def build_reachability_graph(
         cpn: CPN,
         initial_marking: Marking,
         context: EvaluationContext,
         marking_equiv_func: Callable[[Marking], Any] = equiv_marking_to_key,
-        binding_equiv_func: Callable[[Dict[str, Any]], Any] = equiv_binding
+        binding_equiv_func: Callable[[Dict[str, Any]], Any] = equiv_binding,
+        semantics: str = "interleaving",
+        max_states: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        max_memory: Optional[int] = None,
+        order: str = "bfs",
+        seed: Any = None
 ) -> nx.DiGraph:
     """
     Build the reachability graph of the given CPN starting from initial_marking.
+
+    semantics="interleaving" (default) fires one binding element per edge. With semantics="step", every edge
+    is a maximal step of concurrently enabled binding elements (see CPN.find_step), greedily grown from each
+    enabled binding; the edge attributes transition and binding are then tuples with one entry per element.
+
+    The exploration can be bounded, e.g. for nets with unbounded places: max_states stored states, max_depth
+    firings from the initial marking, a wall-clock time_budget in seconds, and max_memory bytes of current resident
+    memory of the process (read from /proc on Linux, else through psutil). order is the search order: "bfs" (default), "dfs" or "random" (seeded by seed).
+    The graph attributes tell whether the result is partial: RG.graph["complete"], RG.graph["termination"]
+    ("complete", "max_states", "max_depth", "time_budget" or "max_memory") and RG.graph["frontier"], the nodes
+    whose successors were not (all) explored.
+
+    Every node holds its full Marking; for large state spaces, see build_state_store.
     """
     RG = nx.DiGraph()
-    visited: Set[Any] = set()
-    queue = deque()
-
-    init_key = marking_equiv_func(initial_marking)
-    RG.add_node(init_key, marking=copy_marking(initial_marking))
-    visited.add(init_key)
-    queue.append(init_key)
-
-    while queue:
-        current_key = queue.popleft()
-        current_marking = RG.nodes[current_key]['marking']
-
-        # Find all enabled transitions and their bindings
-        enabled_transitions = []
-        for t in cpn.transitions:
-            bindings = cpn._find_all_bindings(t, current_marking, context)
-            for b in bindings:
-                enabled_transitions.append((t, b))
-
-        # If no transitions are enabled, attempt to advance the global clock
-        if not enabled_transitions:
-            old_clock = current_marking.global_clock
-            cpn.advance_global_clock(current_marking)
-            if current_marking.global_clock > old_clock:
-                # Check if transitions are now enabled
-                new_enabled_transitions = []
-                for t in cpn.transitions:
-                    bindings = cpn._find_all_bindings(t, current_marking, context)
-                    for b in bindings:
-                        new_enabled_transitions.append((t, b))
-                enabled_transitions = new_enabled_transitions
-
-        # For each enabled transition and binding, generate successor marking
-        for (trans, binding) in enabled_transitions:
-            successor_marking = copy_marking(current_marking)
-            # Fire transition
-            cpn.fire_transition(trans, successor_marking, context, binding)
 
-            succ_key = marking_equiv_func(successor_marking)
-            if succ_key not in visited:
-                RG.add_node(succ_key, marking=successor_marking)
-                visited.add(succ_key)
-                queue.append(succ_key)
+    def add_state(marking):
+        key = marking_equiv_func(marking)
+        if key in RG:
+            return key, False
+        RG.add_node(key, marking=marking)
+        return key, True
 
-            canonical_binding = binding_equiv_func(binding)
-            RG.add_edge(current_key, succ_key, transition=trans.name, binding=canonical_binding)
+    def add_edge(source, target, transition, binding):
+        RG.add_edge(source, target, transition=transition, binding=binding)
 
+    termination, frontier = _explore(cpn, initial_marking, context, add_state,
+                                     lambda marking: marking_equiv_func(marking) in RG,
+                                     lambda key: RG.nodes[key]['marking'], add_edge, semantics, binding_equiv_func,
+                                     max_states, max_depth, time_budget, max_memory, order, seed)
+    RG.graph["termination"] = termination
+    RG.graph["complete"] = termination == "complete"
+    RG.graph["frontier"] = frontier
     return RG
 
 
+def build_state_store(
+        cpn: CPN,
+        initial_marking: Marking,
+        context: EvaluationContext,
+        binding_equiv_func: Callable[[Dict[str, Any]], Any] = equiv_binding,
+        semantics: str = "interleaving",
+        max_states: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        max_memory: Optional[int] = None,
+        order: str = "bfs",
+        seed: Any = None
+) -> StateStore:
+    """
+    Explore the same state space as build_reachability_graph, but keep it in a compact StateStore: states are
+    canonical byte strings interned by integer ids, edges are typed arrays, and only the markings of the states
+    being expanded are alive as Marking objects. StateStore.to_networkx gives back a graph.
+    Token values are compared through make_hashable, as in equiv_marking_to_key.
+    The limits and the search order are those of build_reachability_graph; the store's termination, complete
+    and frontier attributes describe the result.
+    """
+    store = StateStore(value_key=make_hashable)
+    termination, frontier = _explore(cpn, initial_marking, context, store.add, store.__contains__, store.decode,
+                                     store.add_edge, semantics, binding_equiv_func,
+                                     max_states, max_depth, time_budget, max_memory, order, seed)
+    store.termination = termination
+    store.complete = termination == "complete"
+    store.frontier = frontier
+    return store
+
+
 # Example usage (place this in a separate script if needed):
 if __name__ == "__main__":
     # Example: A simple CPN and initial marking
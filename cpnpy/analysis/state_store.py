@@ -0,0 +1,188 @@
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import networkx as nx
+
+from cpnpy.cpn.cpn_imp import *
+from cpnpy.util.hashing import token_value_key
+
+
+class StateStore:
+    """
+    Compact storage of a state space.
+
+    Every marking is serialised to a canonical byte string: the global clock, then, place by place, the
+    (value, timestamp, count) runs of its tokens, all written as 64-bit integers in an array('q'). Token values,
+    timestamps and place names are interned, so that the key of a state holds no Python object besides the bytes
+    themselves; equal markings (up to the order of their places and tokens) give equal keys.
+    States are numbered 0, 1, 2, ... in insertion order, and the keys are interned in a single dict key -> id.
+    Edges are kept in four parallel typed arrays (source, target, label, binding), the labels and the
+    canonical bindings being interned as well; unlike in a DiGraph, two binding elements leading to the same
+    successor give two edges.
+
+    Markings are only rebuilt on demand, by decode.
+
+    value_key maps a token value to the hashable key it is interned by (token_value_key by default, i.e. the
+    identity of the values in a Multiset); two values with the same key are the same in the stored states.
+    """
+
+    def __init__(self, value_key: Callable[[Any], Any] = token_value_key):
+        self.value_key = value_key
+        # Interned token values (by value_key), timestamps and place names: object -> code, code -> object
+        self._value_ids: Dict[Any, int] = {}
+        self._values: List[Any] = []
+        self._ts_ids: Dict[Any, int] = {}
+        self._timestamps: List[Any] = []
+        self._place_ids: Dict[str, int] = {}
+        self._places: List[str] = []
+        # State key -> state id, state id -> key
+        self._ids: Dict[bytes, int] = {}
+        self._keys: List[bytes] = []
+        # Edges, and their interned transition labels and bindings
+        self._sources = array("q")
+        self._targets = array("q")
+        self._labels = array("q")
+        self._bindings = array("q")
+        self._label_ids: Dict[Any, int] = {}
+        self._label_values: List[Any] = []
+        self._binding_ids: Dict[Any, int] = {}
+        self._binding_values: List[Any] = []
+        # Set by the exploration that filled the store (see build_state_store)
+        self.termination: Optional[str] = None
+        self.complete = False
+        self.frontier: List[int] = []
+
+    # -----------------------------------------------------------------------------------
+    # Interning
+    # -----------------------------------------------------------------------------------
+    @staticmethod
+    def _intern(ids: Dict[Any, int], values: List[Any], key: Any, value: Any) -> int:
+        code = ids.get(key)
+        if code is None:
+            code = ids[key] = len(values)
+            values.append(value)
+        return code
+
+    def _place_id(self, place_name: str) -> int:
+        return self._intern(self._place_ids, self._places, place_name, place_name)
+
+    def _value_id(self, value: Any) -> int:
+        return self._intern(self._value_ids, self._values, self.value_key(value), value)
+
+    def _ts_id(self, ts: Any) -> int:
+        return self._intern(self._ts_ids, self._timestamps, ts, ts)
+
+    def interned_size(self) -> int:
+        """Number of interned token values, timestamps and place names."""
+        return len(self._values) + len(self._timestamps) + len(self._places)
+
+    # -----------------------------------------------------------------------------------
+    # Encoding
+    # -----------------------------------------------------------------------------------
+    def encode(self, marking: Marking) -> bytes:
+        """
+        Canonical byte string of the marking:
+        [clock, place, n_runs, (value, timestamp, count) * n_runs, place, n_runs, ...], places sorted by code,
+        runs sorted by (value code, timestamp code).
+        """
+        places = []
+        for place_name, ms in marking._marking.items():
+            runs = []
+            for value, timestamps in ms.items():
+                value_id = self._value_id(value)
+                previous, count = timestamps[0], 0
+                for ts in timestamps:
+                    if ts != previous:
+                        runs.append((value_id, self._ts_id(previous), count))
+                        previous, count = ts, 0
+                    count += 1
+                runs.append((value_id, self._ts_id(previous), count))
+            runs.sort()
+            places.append((self._place_id(place_name), runs))
+        places.sort()
+
+        data = array("q", (self._ts_id(marking.global_clock),))
+        for place_id, runs in places:
+            data.append(place_id)
+            data.append(len(runs))
+            for run in runs:
+                data.extend(run)
+        return data.tobytes()
+
+    def decode_key(self, key: bytes) -> Marking:
+        data = array("q")
+        data.frombytes(key)
+        marking = Marking()
+        marking.global_clock = self._timestamps[data[0]]
+        pos = 1
+        while pos < len(data):
+            ms = marking._marking[self._places[data[pos]]] = Multiset()
+            end = pos + 2 + 3 * data[pos + 1]
+            for i in range(pos + 2, end, 3):
+                ms.add(self._values[data[i]], self._timestamps[data[i + 1]], data[i + 2])
+            pos = end
+        return marking
+
+    # -----------------------------------------------------------------------------------
+    # States
+    # -----------------------------------------------------------------------------------
+    def add(self, marking: Marking) -> Tuple[int, bool]:
+        """Intern the marking; returns its state id and whether it is new."""
+        key = self.encode(marking)
+        state_id = self._ids.get(key)
+        if state_id is not None:
+            return state_id, False
+        state_id = self._ids[key] = len(self._keys)
+        self._keys.append(key)
+        return state_id, True
+
+    def lookup(self, marking: Marking) -> Optional[int]:
+        """State id of the marking, or None if it is not stored."""
+        return self._ids.get(self.encode(marking))
+
+    def decode(self, state_id: int) -> Marking:
+        """Fresh Marking of the given state."""
+        return self.decode_key(self._keys[state_id])
+
+    def key(self, state_id: int) -> bytes:
+        return self._keys[state_id]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, marking: Marking) -> bool:
+        return self.lookup(marking) is not None
+
+    # -----------------------------------------------------------------------------------
+    # Edges
+    # -----------------------------------------------------------------------------------
+    def add_edge(self, source: int, target: int, transition: Any, binding: Any):
+        self._sources.append(source)
+        self._targets.append(target)
+        self._labels.append(self._intern(self._label_ids, self._label_values, transition, transition))
+        self._bindings.append(self._intern(self._binding_ids, self._binding_values, binding, binding))
+
+    def number_of_edges(self) -> int:
+        return len(self._sources)
+
+    def iter_edges(self) -> Iterator[Tuple[int, int, Any, Any]]:
+        """Yield (source, target, transition, binding) for every edge."""
+        labels = self._label_values
+        bindings = self._binding_values
+        for source, target, label, binding in zip(self._sources, self._targets, self._labels, self._bindings):
+            yield source, target, labels[label], bindings[binding]
+
+    def to_networkx(self) -> nx.DiGraph:
+        """
+        Reachability graph with the state ids as nodes, each holding its decoded 'marking', and the transition and
+        binding of every edge as attributes, as built by build_reachability_graph (parallel edges are merged).
+        """
+        RG = nx.DiGraph(termination=self.termination, complete=self.complete, frontier=list(self.frontier))
+        for state_id in range(len(self._keys)):
+            RG.add_node(state_id, marking=self.decode(state_id))
+        for source, target, transition, binding in self.iter_edges():
+            RG.add_edge(source, target, transition=transition, binding=binding)
+        return RG
+
+    def __repr__(self):
+        return f"StateStore({len(self._keys)} states, {len(self._sources)} edges)"
@@ -0,0 +1,189 @@
+import heapq
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from cpnpy.analysis.reachability import equiv_binding, iter_successors, make_hashable
+from cpnpy.analysis.state_store import StateStore
+from cpnpy.cpn.cpn_imp import *
+
+
+class SweepLineResult:
+    """
+    What a sweep-line exploration keeps of the state space: counts, dead markings and place bounds, gathered as
+    the states are generated (see sweep_line_explore). The method names follow StateSpaceAnalyzer.
+    """
+
+    def __init__(self, place_names: List[str]):
+        self.n_states = 0
+        self.n_arcs = 0
+        self.n_layers = 0
+        # Largest number of states held in memory at once
+        self.peak_stored_states = 0
+        self.final_clock = 0
+        self.termination: Optional[str] = None
+        self.computation_time = 0.0
+        self.dead_markings: List[Marking] = []
+        # Arcs to states beyond max_clock, which are not explored
+        self.n_cut_arcs = 0
+        # Markings whose successors were not all explored: cut by max_clock, or left when time_budget ran out
+        self.frontier: List[Marking] = []
+        self.place_min: Dict[str, int] = {p: -1 for p in place_names}
+        self.place_max: Dict[str, int] = {p: 0 for p in place_names}
+
+    @property
+    def complete(self) -> bool:
+        return self.termination == "complete"
+
+    def _record(self, marking: Marking):
+        for p in self.place_min:
+            count = len(marking.get_multiset(p))
+            if self.place_min[p] < 0 or count < self.place_min[p]:
+                self.place_min[p] = count
+            if count > self.place_max[p]:
+                self.place_max[p] = count
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            "RG_nodes": self.n_states,
+            "RG_arcs": self.n_arcs,
+            "layers": self.n_layers,
+            "peak_stored_states": self.peak_stored_states,
+            "final_clock": self.final_clock,
+            "cut_arcs": self.n_cut_arcs,
+            "frontier_size": len(self.frontier),
+            "complete": self.complete,
+            "termination": self.termination,
+            "computation_time": self.computation_time
+        }
+
+    def list_dead_markings(self) -> List[Marking]:
+        """Markings without any successor, even after advancing the global clock."""
+        return list(self.dead_markings)
+
+    def list_unexplored_markings(self) -> List[Marking]:
+        """Markings whose successors were not (all) explored because a limit stopped the exploration."""
+        return list(self.frontier)
+
+    def get_place_bounds(self) -> Dict[str, Tuple[int, int]]:
+        """{place_name: (min_tokens, max_tokens)} over the explored markings."""
+        return {p: (max(self.place_min[p], 0), self.place_max[p]) for p in self.place_min}
+
+    def __repr__(self):
+        return (f"SweepLineResult({self.n_states} states, {self.n_arcs} arcs, {self.n_layers} layers, "
+                f"peak {self.peak_stored_states}, {self.termination})")
+
+
+def _compact(encoder: StateStore, layers: Dict[Any, Tuple[Set[bytes], deque]]) -> StateStore:
+    """
+    Re-encode the stored layers with a fresh StateStore, so that the token values and timestamps interned for
+    the deleted layers are released; the layers are updated in place and the new encoder is returned.
+    """
+    fresh = StateStore(value_key=encoder.value_key)
+    for clock, (seen, queue) in list(layers.items()):
+        keys = {key: fresh.encode(encoder.decode_key(key)) for key in seen}
+        layers[clock] = (set(keys.values()), deque(keys[key] for key in queue))
+    return fresh
+
+
+def sweep_line_explore(
+        cpn: CPN,
+        initial_marking: Marking,
+        context: EvaluationContext,
+        binding_equiv_func: Callable[[Dict[str, Any]], Any] = equiv_binding,
+        semantics: str = "interleaving",
+        max_clock: Optional[int] = None,
+        time_budget: Optional[float] = None
+) -> SweepLineResult:
+    """
+    Explore the state space of a timed net with the sweep-line method, using the global clock as progress
+    measure.
+
+    Firing a binding element never changes the global clock and advancing it only increases it, so every
+    successor of a marking has a clock at least as large as the marking's. The states are therefore explored
+    layer by layer, by increasing clock: once all the states of a layer are expanded, no new state with that
+    clock can be generated, and the layer is deleted from memory. Only the layers ahead of the sweep line are
+    stored (as the canonical byte strings of a StateStore, whose interning tables are rebuilt from the stored
+    layers whenever they have doubled), so the memory used is bounded by the largest layers rather than by the
+    whole state space; the exploration is still exhaustive and visits every state once.
+
+    The reachability graph itself is not kept: the result holds the number of states and arcs, the dead
+    markings and the place bounds (see SweepLineResult). Successors are generated by iter_successors, as in
+    build_reachability_graph. States with a clock beyond max_clock are not explored (the arcs to them are counted
+    in result.n_cut_arcs), and the exploration stops after time_budget seconds; the result is then incomplete
+    (result.termination says why) and result.frontier holds the markings whose successors were not all explored.
+    """
+    if semantics not in ("interleaving", "step"):
+        raise ValueError(f"Unknown semantics: {semantics}")
+    context.compile_net(cpn)
+    start = time.monotonic()
+    deadline = start + time_budget if time_budget is not None else None
+
+    encoder = StateStore(value_key=make_hashable)
+    result = SweepLineResult([p.name for p in cpn.places])
+    # Layers ahead of the sweep line: clock -> (keys of the states seen, keys of the states to expand)
+    layers: Dict[Any, Tuple[Set[bytes], deque]] = {}
+    clocks: List[Any] = []
+    stored = 0
+    compact_at = 1024
+
+    def add_state(marking: Marking) -> bool:
+        # False if the marking is beyond max_clock, and so not explored
+        nonlocal stored
+        clock = marking.global_clock
+        if max_clock is not None and clock > max_clock:
+            return False
+        layer = layers.get(clock)
+        if layer is None:
+            layer = layers[clock] = (set(), deque())
+            heapq.heappush(clocks, clock)
+        key = encoder.encode(marking)
+        if key in layer[0]:
+            return True
+        layer[0].add(key)
+        layer[1].append(key)
+        result.n_states += 1
+        result._record(marking)
+        stored += 1
+        result.peak_stored_states = max(result.peak_stored_states, stored)
+        return True
+
+    add_state(initial_marking)
+    while clocks and result.termination is None:
+        clock = heapq.heappop(clocks)
+        seen, queue = layers[clock]
+        result.n_layers += 1
+        result.final_clock = clock
+        while queue:
+            if deadline is not None and time.monotonic() > deadline:
+                result.termination = "time_budget"
+                break
+            key = queue.popleft()
+            n_successors = n_cut = 0
+            for _, _, successor_marking in iter_successors(cpn, encoder.decode_key(key), context, semantics,
+                                                           binding_equiv_func):
+                n_successors += 1
+                if not add_state(successor_marking):
+                    n_cut += 1
+            result.n_arcs += n_successors - n_cut
+            result.n_cut_arcs += n_cut
+            if n_successors == 0:
+                result.dead_markings.append(encoder.decode_key(key))
+            elif n_cut:
+                result.frontier.append(encoder.decode_key(key))
+        if result.termination is not None:
+            # The states not expanded yet, in this layer and the ones ahead, stay on the frontier
+            heapq.heappush(clocks, clock)
+            result.frontier.extend(encoder.decode_key(key) for c in sorted(clocks) for key in layers[c][1])
+            break
+        # Every state of the layer is expanded: nothing can lead back to it anymore
+        del layers[clock]
+        stored -= len(seen)
+        if encoder.interned_size() >= compact_at:
+            encoder = _compact(encoder, layers)
+            compact_at = max(1024, 2 * encoder.interned_size())
+
+    if result.termination is None:
+        result.termination = "max_clock" if result.n_cut_arcs else "complete"
+    result.computation_time = time.monotonic() - start
+    return result
@@ -0,0 +1,364 @@
+import ast
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from cpnpy.cpn.expressions import split_arc_expression
+from cpnpy.util.hashing import token_value_key
+
+
+# -----------------------------------------------------------------------------------
+# Token patterns read from input arc inscriptions
+# -----------------------------------------------------------------------------------
+# A pattern describes the shape of one token consumed by an input arc:
+#   (VAR, name)          the token (or component) is bound to the transition variable 'name'
+#   (CONST, value)       the token (or component) must be equal to a literal value
+#   (TUPLE, (p1, ...))   the token (or component) is a tuple whose components match p1, ...
+#   (ANY, None)          any other sub-expression: it does not bind variables, and its value
+#                        is only verified once the binding is complete
+VAR, CONST, TUPLE, ANY = range(4)
+
+
+def _to_pattern(node: ast.AST, variables: Sequence[str]) -> Tuple[int, Any]:
+    if isinstance(node, ast.Name) and node.id in variables:
+        return VAR, node.id
+    if isinstance(node, ast.Constant):
+        return CONST, node.value
+    if isinstance(node, ast.Tuple) and not any(isinstance(e, ast.Starred) for e in node.elts):
+        return TUPLE, tuple(_to_pattern(e, variables) for e in node.elts)
+    return ANY, None
+
+
+def parse_token_patterns(value_source: str, variables: Sequence[str]) -> List[Tuple[int, Any]]:
+    """
+    Read the value part of an input arc inscription and return the patterns of the tokens it consumes.
+    A list display ("[x, (y, 'a')]") consumes one token per element; any other expression consumes one token.
+    Returns an empty list when nothing can be said about the consumed tokens (e.g. "f(x)").
+    """
+    try:
+        node = ast.parse(value_source, mode="eval").body
+    except SyntaxError:
+        return []
+    if isinstance(node, ast.List):
+        if any(isinstance(e, ast.Starred) for e in node.elts):
+            return []
+        elements = node.elts
+    else:
+        elements = [node]
+    patterns = [_to_pattern(e, variables) for e in elements]
+    # A top-level ANY may evaluate to a list of tokens, so it cannot be matched against a single token
+    return [p for p in patterns if p[0] != ANY]
+
+
+def pattern_variables(pattern: Tuple[int, Any]) -> List[str]:
+    kind, arg = pattern
+    if kind == VAR:
+        return [arg]
+    if kind == TUPLE:
+        return [v for sub in arg for v in pattern_variables(sub)]
+    return []
+
+
+def match_pattern(pattern: Tuple[int, Any], value: Any, binding: Dict[str, Any], new_vars: List[str]) -> bool:
+    """
+    Match a token value against a pattern, extending binding in place. The names of the variables
+    bound by the match are appended to new_vars, so that the caller can undo them.
+    """
+    kind, arg = pattern
+    if kind == VAR:
+        if arg in binding:
+            return binding[arg] == value
+        binding[arg] = value
+        new_vars.append(arg)
+        return True
+    if kind == CONST:
+        return value == arg
+    if kind == TUPLE:
+        if not isinstance(value, tuple) or len(value) != len(arg):
+            return False
+        for sub, component in zip(arg, value):
+            if not match_pattern(sub, component, binding, new_vars):
+                return False
+        return True
+    return True
+
+
+_NOT_GROUND = object()
+
+
+def instantiate_pattern(pattern: Tuple[int, Any], binding: Dict[str, Any]) -> Any:
+    """
+    Return the token value described by the pattern under the binding, or _NOT_GROUND when
+    some variable is unbound or some component is not a plain variable/constant.
+    """
+    kind, arg = pattern
+    if kind == VAR:
+        return binding.get(arg, _NOT_GROUND)
+    if kind == CONST:
+        return arg
+    if kind == TUPLE:
+        components = []
+        for sub in arg:
+            component = instantiate_pattern(sub, binding)
+            if component is _NOT_GROUND:
+                return _NOT_GROUND
+            components.append(component)
+        return tuple(components)
+    return _NOT_GROUND
+
+
+# -----------------------------------------------------------------------------------
+# Guard conjuncts
+# -----------------------------------------------------------------------------------
+def _flatten_and(node: ast.AST) -> List[ast.AST]:
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        return [c for v in node.values for c in _flatten_and(v)]
+    return [node]
+
+
+def split_guard(guard_expr: str, variables: Sequence[str]) -> Optional[List[Tuple[Any, frozenset]]]:
+    """
+    Split a guard into its top-level conjuncts ("a and (b and c)" -> a, b, c). Returns a list of
+    (compiled conjunct, set of transition variables it reads), or None if the guard does not parse.
+    """
+    try:
+        node = ast.parse(guard_expr.strip(), mode="eval").body
+    except SyntaxError:
+        return None
+    conjuncts = []
+    for conjunct in _flatten_and(node):
+        names = frozenset(n.id for n in ast.walk(conjunct) if isinstance(n, ast.Name) and n.id in variables)
+        expression = ast.fix_missing_locations(ast.Expression(body=conjunct))
+        conjuncts.append((compile(expression, "<guard>", "eval"), names))
+    return conjuncts
+
+
+# -----------------------------------------------------------------------------------
+# Binding plan of a transition
+# -----------------------------------------------------------------------------------
+class _DirectDomain:
+    """
+    Candidate values of a variable read directly from one or more places: the values having a ready token in
+    all of them. They are enumerated lazily (and again on every iteration), so that a search stopping at the
+    first binding does not pay for the whole place; size is an upper bound used to order the search.
+    """
+    __slots__ = ("multisets", "clock", "size")
+
+    def __init__(self, multisets, clock):
+        self.multisets = sorted(multisets, key=lambda ms: ms.distinct_count())
+        self.clock = clock
+        self.size = self.multisets[0].distinct_count()
+
+    def __iter__(self) -> Iterator[Any]:
+        # The values are snapshot, so that the marking can be modified (e.g. by firing) while the search is
+        # suspended; every value is checked against the multisets as they are when it is reached
+        clock = self.clock
+        for value in self.multisets[0].distinct_values():
+            if all(ms.count_ready(value, clock) > 0 for ms in self.multisets):
+                yield value
+
+    def is_empty(self) -> bool:
+        for _ in self:
+            return False
+        return True
+
+    def __contains__(self, value: Any) -> bool:
+        return all(ms.count_ready(value, self.clock) > 0 for ms in self.multisets)
+
+
+class BindingPlan:
+    """
+    Precomputed binding strategy for a transition, derived from its variables and input arc inscriptions.
+
+    - direct: variables that are a whole token of some input place ("x" or "[x]"); their candidate values
+      are the ready values of those places, intersected when the variable occurs on several arcs.
+    - patterns: structured token patterns (tuples, constants) matched against the ready values of their place.
+    - free: variables that no input arc binds; as before, they range over all ready input token values.
+    - conjuncts: the top-level 'and' operands of the guard, each evaluated as soon as the variables it reads
+      are bound, so that failing partial bindings are cut off early.
+    Every complete binding is eventually verified against the input arcs (and the guard, unless all of its
+    conjuncts were already verified).
+    """
+
+    def __init__(self, variables: Sequence[str], input_arcs: Sequence[Tuple[str, str]],
+                 guard_expr: Optional[str] = None):
+        self.variables = list(variables)
+        self.direct: Dict[str, List[str]] = {}
+        self.patterns: List[Tuple[str, Tuple[int, Any]]] = []
+        self.input_places: List[str] = []
+        bound = set()
+        for place_name, expression in input_arcs:
+            if place_name not in self.input_places:
+                self.input_places.append(place_name)
+            value_source, _ = split_arc_expression(expression)
+            for pattern in parse_token_patterns(value_source, self.variables):
+                if pattern[0] == VAR:
+                    places = self.direct.setdefault(pattern[1], [])
+                    if place_name not in places:
+                        places.append(place_name)
+                else:
+                    self.patterns.append((place_name, pattern))
+                bound.update(pattern_variables(pattern))
+        self.free = [v for v in self.variables if v not in bound]
+        # Guard conjuncts with the transition variables they read; None when there is no guard or it cannot be split
+        self.conjuncts = split_guard(guard_expr, self.variables) if guard_expr else None
+
+    def _direct_domain(self, var: str, marking) -> "_DirectDomain":
+        return _DirectDomain([marking.get_multiset(place_name) for place_name in self.direct[var]],
+                             marking.global_clock)
+
+    def _pool(self, marking) -> List[Any]:
+        # Distinct ready values over all the input places: each value is tried once, whatever its multiplicity
+        clock = marking.global_clock
+        pool = {}
+        for place_name in self.input_places:
+            for value, _ in marking.get_multiset(place_name).ready_values(clock):
+                pool.setdefault(token_value_key(value), value)
+        return list(pool.values())
+
+    def iter_bindings(self, cpn, t, marking, context, rng=None) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yield the bindings of t that are enabled in the marking. If rng (any object with a
+        shuffle(list) method, e.g. random.Random or numpy.random.Generator) is given, the candidates of
+        every step are visited in random order.
+        """
+        clock = marking.global_clock
+        # Candidate values of the directly bound variables, smallest domains first
+        domains = []
+        for var in self.direct:
+            domain = self._direct_domain(var, marking)
+            if domain.is_empty():
+                return
+            domains.append((var, domain))
+        domains.sort(key=lambda x: x[1].size)
+
+        # Each structured pattern is matched as soon as one of its variables has been bound
+        steps = []
+        pending = list(self.patterns)
+        bound = set()
+        for var, domain in domains:
+            if var in bound:
+                # Already bound by a pattern: its direct arcs only check the value
+                steps.append(["check", var, domain, []])
+                continue
+            steps.append(["var", var, domain, [var]])
+            bound.add(var)
+            for entry in [e for e in pending if bound.intersection(pattern_variables(e[1]))]:
+                steps.append(["pattern", entry[1], marking.get_multiset(entry[0]), pattern_variables(entry[1])])
+                bound.update(pattern_variables(entry[1]))
+                pending.remove(entry)
+        for place_name, pattern in pending:
+            steps.append(["pattern", pattern, marking.get_multiset(place_name), pattern_variables(pattern)])
+        if self.free:
+            pool = self._pool(marking)
+            for var in self.free:
+                steps.append(["var", var, pool, [var]])
+
+        # Attach every guard conjunct to the first step after which all of its variables are bound
+        initial_checks, steps, final_guard = self._schedule_conjuncts(steps)
+        search = (steps, clock, cpn, t, marking, context, final_guard, rng)
+
+        binding: Dict[str, Any] = {}
+        deferred = False
+        if initial_checks:
+            ok, deferred = self._check_conjuncts(initial_checks, binding, context)
+            if not ok:
+                return
+        yield from self._backtrack(search, 0, binding, deferred)
+
+    def _schedule_conjuncts(self, steps):
+        if self.conjuncts is None:
+            return [], [tuple(step[:3]) + ((),) for step in steps], True
+        bound = set()
+        remaining = list(self.conjuncts)
+        initial_checks = [code for code, needed in remaining if not needed]
+        remaining = [(code, needed) for code, needed in remaining if needed]
+        scheduled = []
+        for kind, arg, candidates, step_vars in steps:
+            bound.update(step_vars)
+            checks = tuple(code for code, needed in remaining if needed <= bound)
+            if checks:
+                remaining = [(code, needed) for code, needed in remaining if not needed <= bound]
+            scheduled.append((kind, arg, candidates, checks))
+        # Conjuncts that need variables no step binds are left to the final guard evaluation
+        return initial_checks, scheduled, bool(remaining)
+
+    @staticmethod
+    def _check_conjuncts(checks, binding, context) -> Tuple[bool, bool]:
+        """
+        Evaluate guard conjuncts on a partial binding. Returns (ok, deferred): ok is False when some
+        conjunct is false, so that no extension of the binding can satisfy the guard; deferred is True
+        when some conjunct could not be evaluated and has to be verified on the complete binding.
+        """
+        deferred = False
+        for code in checks:
+            try:
+                if not eval(code, context.env, binding):
+                    return False, deferred
+            except Exception:
+                deferred = True
+        return True, deferred
+
+    def _backtrack(self, search, i, binding, deferred) -> Iterator[Dict[str, Any]]:
+        steps, clock, cpn, t, marking, context, final_guard, rng = search
+        if i == len(steps):
+            # The guard needs a final evaluation only if some conjunct was not verified on the way
+            if cpn._check_enabled_with_binding(t, marking, context, binding, check_guard=final_guard or deferred):
+                yield dict(binding)
+            return
+
+        kind, arg, candidates, checks = steps[i]
+        if kind == "var":
+            if rng is not None:
+                candidates = list(candidates)
+                rng.shuffle(candidates)
+            for value in candidates:
+                binding[arg] = value
+                if checks:
+                    ok, now_deferred = self._check_conjuncts(checks, binding, context)
+                    if not ok:
+                        continue
+                    yield from self._backtrack(search, i + 1, binding, deferred or now_deferred)
+                else:
+                    yield from self._backtrack(search, i + 1, binding, deferred)
+            binding.pop(arg, None)
+            return
+
+        if kind == "check":
+            if binding[arg] in candidates:
+                ok, now_deferred = self._check_conjuncts(checks, binding, context)
+                if ok:
+                    yield from self._backtrack(search, i + 1, binding, deferred or now_deferred)
+            return
+
+        # Pattern step: candidates is the multiset of the input place
+        ground = instantiate_pattern(arg, binding)
+        if ground is not _NOT_GROUND:
+            # Every component is known: a direct lookup replaces the scan of the place
+            if candidates.count_ready(ground, clock) > 0:
+                ok, now_deferred = self._check_conjuncts(checks, binding, context)
+                if ok:
+                    yield from self._backtrack(search, i + 1, binding, deferred or now_deferred)
+            return
+        # Different token values can agree on the variables the pattern binds (e.g. when some component
+        # is an arbitrary expression): each assignment of the newly bound variables is explored once
+        seen = set()
+        values = list(candidates.ready_values(clock))
+        if rng is not None:
+            rng.shuffle(values)
+        for value, _ in values:
+            new_vars: List[str] = []
+            if match_pattern(arg, value, binding, new_vars):
+                assignment = tuple(token_value_key(binding[var]) for var in new_vars)
+                if assignment not in seen:
+                    seen.add(assignment)
+                    ok, now_deferred = self._check_conjuncts(checks, binding, context)
+                    if ok:
+                        yield from self._backtrack(search, i + 1, binding, deferred or now_deferred)
+            for var in new_vars:
+                del binding[var]
+
+
+def plan_signature(t, input_arcs) -> Tuple[Any, ...]:
+    """
+    Everything a BindingPlan depends on; a cached plan is rebuilt when this changes.
+    """
+    return (tuple(t.variables), t.guard_expr) + tuple((a.source.name, a.expression) for a in input_arcs)
@@ -1,13 +1,24 @@
+import bisect
 import copy
-from collections import Counter
-from typing import Optional, Union
+import heapq
+import itertools
+import math
+import sys
+from types import CodeType
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
 from cpnpy.cpn.colorsets import *
+from cpnpy.cpn.expressions import CompiledArcExpression, compile_expression
+from cpnpy.cpn.binding import BindingPlan, plan_signature
+from cpnpy.util.hashing import token_value_key
 
 
 # -----------------------------------------------------------------------------------
 # Token with Time
 # -----------------------------------------------------------------------------------
 class Token:
+    # No per-instance __dict__: markings can hold millions of tokens
+    __slots__ = ("value", "timestamp")
+
     def __init__(self, value: Any, timestamp: int = 0):
         self.value = value
         self.timestamp = timestamp  # For timed tokens
@@ -36,43 +47,177 @@ class Token:
 
 
 class Multiset:
+    """
+    Multiset of (possibly timed) tokens. Tokens are grouped by value: for every distinct value
+    we keep the value itself and the sorted list of the timestamps of its tokens, so that counting,
+    removing and checking readiness do not need to scan all the tokens of the place.
+
+    The distinct timestamps are also kept in a min-heap (with lazy deletion, driven by the number of tokens
+    per timestamp), so that the next future timestamp needed to advance the clock is found in O(log n).
+    """
+    __slots__ = ("_values", "_timestamps", "_size", "_version", "_ts_counts", "_ts_heap", "_heap_floor")
+
     def __init__(self, tokens: Optional[List[Token]] = None):
-        if tokens is None:
-            tokens = []
-        self.tokens = tokens
+        self._values: Dict[Any, Any] = {}
+        self._timestamps: Dict[Any, List[int]] = {}
+        self._size = 0
+        # Incremented on every change, so that caches can tell whether the place content changed
+        self._version = 0
+        # Number of tokens per timestamp, and heap of the timestamps > _heap_floor (None: to be rebuilt)
+        self._ts_counts: Dict[int, int] = {}
+        self._ts_heap: Optional[List[int]] = []
+        self._heap_floor = None
+        if tokens is not None:
+            for tok in tokens:
+                self.add(tok.value, tok.timestamp)
+
+    @property
+    def tokens(self) -> List[Token]:
+        # Materialized on demand; values are grouped together and ordered by timestamp
+        return [Token(self._values[key], ts) for key, timestamps in self._timestamps.items() for ts in timestamps]
+
+    @tokens.setter
+    def tokens(self, tokens: List[Token]):
+        self._values = {}
+        self._timestamps = {}
+        self._size = 0
+        self._version += 1
+        self._ts_counts = {}
+        self._ts_heap = []
+        self._heap_floor = None
+        for tok in tokens:
+            self.add(tok.value, tok.timestamp)
 
     def add(self, token_value: Any, timestamp: int = 0, count: int = 1):
-        for _ in range(count):
-            self.tokens.append(Token(token_value, timestamp))
-
-    def remove(self, token_value: Any, count: int = 1):
-        # Removing tokens that match token_value, preferring the ones with largest timestamp first
-        matching = [t for t in self.tokens if t.value == token_value]
-        if len(matching) < count:
+        if count <= 0:
+            return
+        key = token_value_key(token_value)
+        timestamps = self._timestamps.get(key)
+        if timestamps is None:
+            self._values[key] = token_value
+            self._timestamps[key] = [timestamp] * count
+        elif timestamps[-1] <= timestamp:
+            timestamps.extend([timestamp] * count)
+        else:
+            pos = bisect.bisect_right(timestamps, timestamp)
+            timestamps[pos:pos] = [timestamp] * count
+        self._size += count
+        self._version += 1
+        previous = self._ts_counts.get(timestamp, 0)
+        self._ts_counts[timestamp] = previous + count
+        if not previous and self._ts_heap is not None and (self._heap_floor is None or timestamp > self._heap_floor):
+            heapq.heappush(self._ts_heap, timestamp)
+
+    def remove(self, token_value: Any, count: int = 1) -> List[int]:
+        # Removing tokens that match token_value, preferring the ones with largest timestamp first.
+        # Returns the timestamps of the removed tokens.
+        key = token_value_key(token_value)
+        timestamps = self._timestamps.get(key)
+        if timestamps is None or len(timestamps) < count:
             raise ValueError("Not enough tokens to remove.")
-        matching.sort(key=lambda x: x.timestamp, reverse=True)
-        to_remove = matching[:count]
-        for tr in to_remove:
-            self.tokens.remove(tr)
+        return self._remove_run(key, timestamps, len(timestamps), count)
+
+    def remove_ready(self, token_value: Any, clock: int, count: int = 1) -> List[int]:
+        """
+        Remove count tokens with the given value whose timestamp is <= clock, the largest timestamps first.
+        Returns the timestamps of the removed tokens.
+        """
+        key = token_value_key(token_value)
+        timestamps = self._timestamps.get(key)
+        if timestamps is None:
+            raise ValueError("Not enough ready tokens to remove.")
+        end = len(timestamps) if timestamps[-1] <= clock else bisect.bisect_right(timestamps, clock)
+        if end < count:
+            raise ValueError("Not enough ready tokens to remove.")
+        return self._remove_run(key, timestamps, end, count)
+
+    def _remove_run(self, key: Any, timestamps: List[int], end: int, count: int) -> List[int]:
+        # Remove timestamps[end - count:end]
+        removed = timestamps[end - count:end]
+        for ts in removed:
+            remaining = self._ts_counts[ts] - 1
+            if remaining:
+                self._ts_counts[ts] = remaining
+            else:
+                # The heap entry, if any, is discarded lazily by next_timestamp
+                del self._ts_counts[ts]
+        del timestamps[end - count:end]
+        if not timestamps:
+            del self._timestamps[key]
+            del self._values[key]
+        self._size -= count
+        self._version += 1
+        return removed
 
     def count_value(self, token_value: Any) -> int:
-        return sum(1 for t in self.tokens if t.value == token_value)
+        timestamps = self._timestamps.get(token_value_key(token_value))
+        return len(timestamps) if timestamps is not None else 0
+
+    def distinct_count(self) -> int:
+        """Number of distinct token values."""
+        return len(self._timestamps)
+
+    def distinct_values(self) -> List[Any]:
+        """The distinct token values, as a new list (unaffected by later changes of the multiset)."""
+        return list(self._values.values())
+
+    def count_ready(self, token_value: Any, clock: int) -> int:
+        """Number of tokens with the given value whose timestamp is <= clock."""
+        timestamps = self._timestamps.get(token_value_key(token_value))
+        if timestamps is None:
+            return 0
+        if timestamps[-1] <= clock:
+            return len(timestamps)
+        return bisect.bisect_right(timestamps, clock)
+
+    def ready_values(self, clock: int) -> Iterator[Tuple[Any, int]]:
+        """Yield (value, number of ready tokens) for every value having at least one token ready at clock."""
+        for key, timestamps in self._timestamps.items():
+            n = len(timestamps) if timestamps[-1] <= clock else bisect.bisect_right(timestamps, clock)
+            if n:
+                yield self._values[key], n
+
+    def items(self) -> Iterator[Tuple[Any, List[int]]]:
+        """Yield (value, sorted timestamps) for every distinct value. The timestamp lists must not be modified."""
+        for key, timestamps in self._timestamps.items():
+            yield self._values[key], timestamps
+
+    def next_timestamp(self, after: int) -> Optional[int]:
+        """Smallest token timestamp strictly greater than after, or None."""
+        heap = self._ts_heap
+        if heap is None or (self._heap_floor is not None and after < self._heap_floor):
+            # First query after a copy, or the clock went backwards: rebuild from the counts
+            heap = self._ts_heap = [ts for ts in self._ts_counts if ts > after]
+            heapq.heapify(heap)
+        else:
+            # Timestamps not above 'after' can be dropped, as long as later queries do not go below it
+            while heap and (heap[0] <= after or heap[0] not in self._ts_counts):
+                heapq.heappop(heap)
+        if self._heap_floor is None or after > self._heap_floor:
+            self._heap_floor = after
+        return heap[0] if heap else None
+
+    def __len__(self) -> int:
+        return self._size
 
     def __le__(self, other: 'Multiset') -> bool:
-        self_counts = Counter(t.value for t in self.tokens)
-        other_counts = Counter(t.value for t in other.tokens)
-        for val, cnt in self_counts.items():
-            if other_counts[val] < cnt:
+        for key, timestamps in self._timestamps.items():
+            other_timestamps = other._timestamps.get(key)
+            if other_timestamps is None or len(other_timestamps) < len(timestamps):
                 return False
         return True
 
     def __add__(self, other: 'Multiset') -> 'Multiset':
-        return Multiset(self.tokens + other.tokens)
+        result = copy.copy(self)
+        for value, timestamps in other.items():
+            for ts in timestamps:
+                result.add(value, ts)
+        return result
 
     def __sub__(self, other: 'Multiset') -> 'Multiset':
-        result = Multiset(self.tokens[:])
-        for t in other.tokens:
-            result.remove(t.value, 1)
+        result = copy.copy(self)
+        for value, timestamps in other.items():
+            result.remove(value, len(timestamps))
         return result
 
     def __repr__(self):
@@ -82,16 +227,28 @@ class Multiset:
     def __copy__(self):
         cls = self.__class__
         result = cls.__new__(cls)
-        # Shallow copy tokens list (but Token objects are referenced)
-        result.tokens = self.tokens[:]
+        # Values are referenced, the timestamp lists are copied
+        result._values = dict(self._values)
+        result._timestamps = {k: v[:] for k, v in self._timestamps.items()}
+        result._size = self._size
+        result._version = 0
+        result._ts_counts = dict(self._ts_counts)
+        result._ts_heap = None
+        result._heap_floor = None
         return result
 
     def __deepcopy__(self, memo):
         cls = self.__class__
         result = cls.__new__(cls)
         memo[id(self)] = result
-        # Deepcopy tokens
-        result.tokens = [copy.deepcopy(t, memo) for t in self.tokens]
+        # Deepcopy values
+        result._values = {k: copy.deepcopy(v, memo) for k, v in self._values.items()}
+        result._timestamps = {k: v[:] for k, v in self._timestamps.items()}
+        result._size = self._size
+        result._version = 0
+        result._ts_counts = dict(self._ts_counts)
+        result._ts_heap = None
+        result._heap_floor = None
         return result
 
 
@@ -99,6 +256,8 @@ class Multiset:
 # Marking with Global Clock
 # -----------------------------------------------------------------------------------
 class Marking:
+    __slots__ = ("_marking", "global_clock")
+
     def __init__(self):
         self._marking: Dict[str, Multiset] = {}
         self.global_clock = 0  # Time support
@@ -106,23 +265,37 @@ class Marking:
     def set_tokens(self, place_name: str, tokens: List[Any], timestamps: Optional[List[int]] = None):
         if timestamps is None:
             timestamps = [0] * len(tokens)
-        self._marking[place_name] = Multiset([Token(v, ts) for v, ts in zip(tokens, timestamps)])
+        ms = Multiset()
+        for v, ts in zip(tokens, timestamps):
+            ms.add(v, ts)
+        self._marking[place_name] = ms
 
     def add_tokens(self, place_name: str, token_values: List[Any], timestamp: int = 0):
-        ms = self._marking.get(place_name, Multiset())
+        ms = self._marking.get(place_name)
+        if ms is None:
+            ms = self._marking[place_name] = Multiset()
         for v in token_values:
             ms.add(v, timestamp=timestamp)
-        self._marking[place_name] = ms
 
     def remove_tokens(self, place_name: str, token_values: List[Any]):
-        ms = self._marking.get(place_name, Multiset())
+        ms = self._marking.get(place_name)
+        if ms is None:
+            ms = self._marking[place_name] = Multiset()
         for v in token_values:
             ms.remove(v)
-        self._marking[place_name] = ms
 
     def get_multiset(self, place_name: str) -> Multiset:
         return self._marking.get(place_name, Multiset())
 
+    def next_timestamp(self) -> Optional[int]:
+        """Smallest token timestamp greater than the global clock over all places, or None."""
+        result = None
+        for ms in self._marking.values():
+            ts = ms.next_timestamp(self.global_clock)
+            if ts is not None and (result is None or ts < result):
+                result = ts
+        return result
+
     def __repr__(self):
         lines = [f"Marking (global_clock={self.global_clock}):"]
         for place, ms in self._marking.items():
@@ -153,44 +326,114 @@ class Marking:
 # EvaluationContext
 # -----------------------------------------------------------------------------------
 class EvaluationContext:
-    def __init__(self, user_code: Optional[str] = None):
+    def __init__(self, user_code: Optional[str] = None, delay_sampler: Any = None):
         self.env = {}
+        # Optional cpnpy.cpn.delays.DelaySampler serving the delays drawn from a distribution (e.g. norm.rvs(...))
+        self.delay_sampler = delay_sampler
+        # Kept so that the context can be pickled: the functions and modules it defines are rebuilt by exec
+        self.user_code = user_code
         if user_code is not None:
             exec(user_code, self.env)
+        self._user_names = frozenset(self.env)
+        # Guards and arc inscriptions are compiled once and cached by their source text
+        self._compiled_guards: Dict[str, CodeType] = {}
+        self._compiled_arcs: Dict[str, CompiledArcExpression] = {}
+
+    def compile_guard(self, guard_expr: str) -> CodeType:
+        code = self._compiled_guards.get(guard_expr)
+        if code is None:
+            code = self._compiled_guards[guard_expr] = compile_expression(guard_expr, "<guard>")
+        return code
+
+    def compile_arc(self, arc_expr: str) -> CompiledArcExpression:
+        compiled = self._compiled_arcs.get(arc_expr)
+        if compiled is None:
+            compiled = self._compiled_arcs[arc_expr] = CompiledArcExpression(arc_expr)
+        return compiled
+
+    def compile_net(self, cpn: 'CPN'):
+        """
+        Precompile the guards and arc inscriptions of the given CPN. Expressions that do not compile
+        are skipped here and will raise when they are evaluated.
+        """
+        for t in cpn.transitions:
+            if t.guard_expr:
+                try:
+                    self.compile_guard(t.guard_expr)
+                except SyntaxError:
+                    pass
+        for a in cpn.arcs:
+            try:
+                self.compile_arc(a.expression)
+            except SyntaxError:
+                pass
 
     def evaluate_guard(self, guard_expr: Optional[str], binding: Dict[str, Any]) -> bool:
         if guard_expr is None:
             return True
-        return bool(eval(guard_expr, self.env, binding))
+        code = self._compiled_guards.get(guard_expr)
+        if code is None:
+            code = self.compile_guard(guard_expr)
+        return bool(eval(code, self.env, binding))
 
     def evaluate_arc(self, arc_expr: str, binding: Dict[str, Any]) -> (List[Any], int):
-        delay = 0
-        if "@+" in arc_expr:
-            parts = arc_expr.split('@+')
-            expr_part = parts[0].strip()
-            delay_part = parts[1].strip()
-            val = eval(expr_part, self.env, binding)
-            delay = eval(delay_part, self.env, binding)
+        compiled = self._compiled_arcs.get(arc_expr)
+        if compiled is None:
+            compiled = self.compile_arc(arc_expr)
+        val = eval(compiled.value_code, self.env, binding)
+        if compiled.delay_code is None:
+            delay = 0
+        elif (compiled.delay_distribution is not None and self.delay_sampler is not None
+              and self._is_scipy_distribution(compiled.delay_distribution[0], binding)):
+            delay = self.delay_sampler.sample(compiled.delay_distribution)
         else:
-            val = eval(arc_expr, self.env, binding)
+            delay = eval(compiled.delay_code, self.env, binding)
 
         if isinstance(val, list):
             return val, delay
         return [val], delay
 
+    def _is_scipy_distribution(self, name: str, binding: Dict[str, Any]) -> bool:
+        # The delay sampler only stands in for the scipy.stats distribution of that name: a name bound or
+        # defined otherwise (or scipy.stats never imported) is evaluated as written
+        stats = sys.modules.get("scipy.stats")
+        distribution = getattr(stats, name, None) if stats is not None else None
+        return distribution is not None and name not in binding and self.env.get(name) is distribution
+
+    def __getstate__(self):
+        # The environment holds functions and modules: only the user code is pickled (and re-executed on
+        # unpickling), together with the entries added to env afterwards, which must be picklable
+        return {"user_code": self.user_code,
+                "env": {k: v for k, v in self.env.items() if k not in self._user_names},
+                "delay_sampler": self.delay_sampler}
+
+    def __setstate__(self, state):
+        self.__init__(state["user_code"], delay_sampler=state.get("delay_sampler"))
+        self.env.update(state["env"])
+
     def __copy__(self):
         cls = self.__class__
         result = cls.__new__(cls)
+        result.user_code = self.user_code
+        result._user_names = self._user_names
+        result.delay_sampler = self.delay_sampler
         # Shallow copy environment
         result.env = self.env.copy()
+        result._compiled_guards = dict(self._compiled_guards)
+        result._compiled_arcs = dict(self._compiled_arcs)
         return result
 
     def __deepcopy__(self, memo):
         cls = self.__class__
         result = cls.__new__(cls)
         memo[id(self)] = result
-        # Deepcopy environment
+        result.user_code = self.user_code
+        result._user_names = self._user_names
+        result.delay_sampler = copy.deepcopy(self.delay_sampler, memo)
+        # Deepcopy environment; compiled code objects are immutable and can be shared
         result.env = copy.deepcopy(self.env, memo)
+        result._compiled_guards = dict(self._compiled_guards)
+        result._compiled_arcs = dict(self._compiled_arcs)
         return result
 
 
@@ -198,6 +441,8 @@ class EvaluationContext:
 # Place, Transition, Arc, CPN with Time
 # -----------------------------------------------------------------------------------
 class Place:
+    __slots__ = ("name", "colorset")
+
     def __init__(self, name: str, colorset: ColorSet):
         self.name = name
         self.colorset = colorset
@@ -224,6 +469,8 @@ class Place:
 
 
 class Transition:
+    __slots__ = ("name", "guard_expr", "variables", "transition_delay")
+
     def __init__(self, name: str, guard: Optional[str] = None, variables: Optional[List[str]] = None,
                  transition_delay: int = 0):
         self.name = name
@@ -257,6 +504,8 @@ class Transition:
 
 
 class Arc:
+    __slots__ = ("source", "target", "expression")
+
     def __init__(self, source: Union['Place', 'Transition'], target: Union['Place', 'Transition'], expression: str):
         self.source = source
         self.target = target
@@ -285,75 +534,228 @@ class Arc:
         return result
 
 
+class Occurrence:
+    """
+    Record of a firing: the binding element and the tokens it moved, as (place, value, timestamp) triples.
+    The timestamps of the produced tokens are final (arc delays included, 0 for untimed places).
+    """
+    __slots__ = ("transition", "binding", "clock", "consumed", "produced")
+
+    def __init__(self, transition: Transition, binding: Dict[str, Any], clock: int,
+                 consumed: List[Tuple[Place, Any, int]], produced: List[Tuple[Place, Any, int]]):
+        self.transition = transition
+        self.binding = binding
+        self.clock = clock
+        self.consumed = consumed
+        self.produced = produced
+
+    def __repr__(self):
+        consumed = ", ".join(f"{p.name}:{v!r}@{ts}" for p, v, ts in self.consumed)
+        produced = ", ".join(f"{p.name}:{v!r}@{ts}" for p, v, ts in self.produced)
+        return f"Occurrence({self.transition.name}, {self.binding}, t={self.clock}, [{consumed}] -> [{produced}])"
+
+
+def _binomial(n: int, k: int) -> int:
+    """Number of ways to choose k items among n (math.comb, which needs Python 3.8)."""
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    result = 1
+    for i in range(1, k + 1):
+        result = result * (n - k + i) // i
+    return result
+
+
 class CPN:
     def __init__(self):
         self.places: List[Place] = []
         self.transitions: List[Transition] = []
         self.arcs: List[Arc] = []
+        # Indexes kept in sync by add_place/add_transition/add_arc, so that the
+        # lookups performed on every enabling check and firing do not scan self.arcs
+        self._place_by_name: Dict[str, Place] = {}
+        self._transition_by_name: Dict[str, Transition] = {}
+        self._input_arcs: Dict[Transition, List[Arc]] = {}
+        self._output_arcs: Dict[Transition, List[Arc]] = {}
+        self._consumers: Dict[str, List[Transition]] = {}
+        self._producers: Dict[str, List[Transition]] = {}
+        # Binding plans derived from the input arc inscriptions, built lazily per transition
+        self._binding_plans: Dict[Transition, Tuple[Any, BindingPlan]] = {}
 
     def add_place(self, place: Place):
         self.places.append(place)
+        self._index_place(place)
 
     def add_transition(self, transition: Transition):
         self.transitions.append(transition)
+        self._index_transition(transition)
 
     def add_arc(self, arc: Arc):
         self.arcs.append(arc)
+        self._index_arc(arc)
+
+    def _index_place(self, place: Place):
+        # The first place with a given name wins, as with the former linear search
+        self._place_by_name.setdefault(place.name, place)
+
+    def _index_transition(self, transition: Transition):
+        self._transition_by_name.setdefault(transition.name, transition)
+
+    def _index_arc(self, arc: Arc):
+        if isinstance(arc.source, Place) and isinstance(arc.target, Transition):
+            self._input_arcs.setdefault(arc.target, []).append(arc)
+            consumers = self._consumers.setdefault(arc.source.name, [])
+            if arc.target not in consumers:
+                consumers.append(arc.target)
+        elif isinstance(arc.source, Transition) and isinstance(arc.target, Place):
+            self._output_arcs.setdefault(arc.source, []).append(arc)
+            producers = self._producers.setdefault(arc.target.name, [])
+            if arc.source not in producers:
+                producers.append(arc.source)
+
+    def _rebuild_index(self):
+        self._place_by_name = {}
+        self._transition_by_name = {}
+        self._input_arcs = {}
+        self._output_arcs = {}
+        self._consumers = {}
+        self._producers = {}
+        self._binding_plans = {}
+        for p in self.places:
+            self._index_place(p)
+        for t in self.transitions:
+            self._index_transition(t)
+        for a in self.arcs:
+            self._index_arc(a)
 
     def get_place_by_name(self, name: str) -> Optional[Place]:
-        for p in self.places:
-            if p.name == name:
-                return p
-        return None
+        return self._place_by_name.get(name)
 
     def get_transition_by_name(self, name: str) -> Optional[Transition]:
-        for t in self.transitions:
-            if t.name == name:
-                return t
-        return None
+        return self._transition_by_name.get(name)
 
     def get_input_arcs(self, t: Transition) -> List[Arc]:
-        return [a for a in self.arcs if isinstance(a.source, Place) and a.target == t]
+        return self._input_arcs.get(t, [])
 
     def get_output_arcs(self, t: Transition) -> List[Arc]:
-        return [a for a in self.arcs if a.source == t and isinstance(a.target, Place)]
+        return self._output_arcs.get(t, [])
+
+    def get_consumers(self, place: Union[Place, str]) -> List[Transition]:
+        """Transitions having an input arc from the given place or place name (the post-set of the place)."""
+        return self._consumers.get(place if isinstance(place, str) else place.name, [])
+
+    def get_producers(self, place: Union[Place, str]) -> List[Transition]:
+        """Transitions having an output arc to the given place or place name (the pre-set of the place)."""
+        return self._producers.get(place if isinstance(place, str) else place.name, [])
 
     def is_enabled(self, t: Transition, marking: Marking, context: EvaluationContext,
                    binding: Optional[Dict[str, Any]] = None) -> bool:
         if binding is None:
-            binding = self._find_binding(t, marking, context)
-            if binding is None:
-                return False
+            # Bindings returned by the binding search are already verified
+            return self._find_binding(t, marking, context) is not None
         return self._check_enabled_with_binding(t, marking, context, binding)
 
     def fire_transition(self, t: Transition, marking: Marking, context: EvaluationContext,
-                        binding: Optional[Dict[str, Any]] = None):
+                        binding: Optional[Dict[str, Any]] = None) -> Occurrence:
+        """
+        Fire t under the binding (or under the first enabled binding found if none is given), and return the
+        Occurrence record of the consumed and produced tokens.
+        """
         if binding is None:
             binding = self._find_binding(t, marking, context)
             if binding is None:
                 raise RuntimeError(f"No valid binding found for transition {t.name}.")
-        if not self._check_enabled_with_binding(t, marking, context, binding):
+        elif not self._check_enabled_with_binding(t, marking, context, binding):
             raise RuntimeError(f"Transition {t.name} is not enabled under the found binding.")
 
         # Remove tokens
+        consumed = []
         for arc in self.get_input_arcs(t):
             values, _ = context.evaluate_arc(arc.expression, binding)
-            marking.remove_tokens(arc.source.name, values)
+            consumed.extend(self._consume(marking, arc.source, values))
 
         # Add tokens with proper timestamps
+        return Occurrence(t, binding, marking.global_clock, consumed, self._produce(t, binding, marking, context))
+
+    @staticmethod
+    def _consume(marking: Marking, place: Place, values: List[Any]) -> List[Tuple[Place, Any, int]]:
+        ms = marking._marking.get(place.name)
+        if ms is None:
+            ms = marking._marking[place.name] = Multiset()
+        clock = marking.global_clock
+        return [(place, v, ms.remove_ready(v, clock)[0]) for v in values]
+
+    def _produce(self, t: Transition, binding: Dict[str, Any], marking: Marking,
+                 context: EvaluationContext) -> List[Tuple[Place, Any, int]]:
+        # Every output inscription (and so every random delay) is evaluated exactly once
+        produced = []
         for arc in self.get_output_arcs(t):
             values, arc_delay = context.evaluate_arc(arc.expression, binding)
+            place = arc.target
+            new_timestamp = marking.global_clock + t.transition_delay + arc_delay if place.colorset.timed else 0
             for v in values:
-                place = arc.target
-                new_timestamp = marking.global_clock + t.transition_delay + arc_delay
-                if place.colorset.timed:
-                    marking.add_tokens(place.name, [v], timestamp=new_timestamp)
-                else:
-                    marking.add_tokens(place.name, [v], timestamp=0)
+                marking.add_tokens(place.name, [v], timestamp=new_timestamp)
+                produced.append((place, v, new_timestamp))
+        return produced
+
+    def fire_batch(self, steps: Iterable[Tuple[Transition, Dict[str, Any]]], marking: Marking,
+                   context: EvaluationContext, validate: bool = True):
+        """
+        Fire many (transition, binding) pairs, already known to be enabled one after the other, in one call.
+
+        The elements are applied in order to a balance per place and token value, without touching the
+        marking, which is then updated once per (place, value). The result is the marking that firing the
+        elements one after the other with fire_transition would give: all of them fire at the current global
+        clock, and every consumed token is the youngest ready one at that point of the sequence. Ready tokens
+        produced earlier in the batch are taken first (they are never older than the ready tokens of the
+        marking, as long as the delays are not negative).
+
+        If validate is True, a RuntimeError is raised before the marking is modified as soon as an element
+        needs more ready tokens than the marking and the elements before it provide. Guards are not evaluated.
+        """
+        clock = marking.global_clock
+        # (place, value key) -> [value, ready tokens of the marking (None: not read yet), number of them taken,
+        #                        {timestamp: number of tokens produced by the batch and still there}]
+        balance: Dict[Tuple[str, Any], List[Any]] = {}
+        for t, binding in steps:
+            for arc in self.get_input_arcs(t):
+                values, _ = context.evaluate_arc(arc.expression, binding)
+                place_name = arc.source.name
+                for v in values:
+                    entry = balance.get((place_name, token_value_key(v)))
+                    if entry is None:
+                        entry = balance[(place_name, token_value_key(v))] = [v, None, 0, {}]
+                    by_ts = entry[3]
+                    ts = max((ts for ts, n in by_ts.items() if n and ts <= clock), default=None)
+                    if ts is not None:
+                        by_ts[ts] -= 1
+                        continue
+                    if entry[1] is None:
+                        entry[1] = marking.get_multiset(place_name).count_ready(v, clock) if validate else math.inf
+                    if entry[2] >= entry[1]:
+                        raise RuntimeError(f"Not enough tokens {v!r} in place {place_name} for the batch.")
+                    entry[2] += 1
+            for arc in self.get_output_arcs(t):
+                values, arc_delay = context.evaluate_arc(arc.expression, binding)
+                ts = clock + t.transition_delay + arc_delay if arc.target.colorset.timed else 0
+                for v in values:
+                    entry = balance.get((arc.target.name, token_value_key(v)))
+                    if entry is None:
+                        entry = balance[(arc.target.name, token_value_key(v))] = [v, None, 0, {}]
+                    entry[3][ts] = entry[3].get(ts, 0) + 1
+
+        for (place_name, _), (v, _, taken, by_ts) in balance.items():
+            ms = marking._marking.get(place_name)
+            if ms is None:
+                ms = marking._marking[place_name] = Multiset()
+            if taken:
+                ms.remove_ready(v, clock, taken)
+            for ts, count in by_ts.items():
+                ms.add(v, timestamp=ts, count=count)
 
     def _check_enabled_with_binding(self, t: Transition, marking: Marking, context: EvaluationContext,
-                                    binding: Dict[str, Any]) -> bool:
-        if t.guard_expr:
+                                    binding: Dict[str, Any], check_guard: bool = True) -> bool:
+        if check_guard and t.guard_expr:
             if not context.evaluate_guard(t.guard_expr, binding):
                 return False
         # Check input arcs and timestamps
@@ -362,91 +764,152 @@ class CPN:
             place_marking = marking.get_multiset(arc.source.name)
             # Check if we have enough ready tokens (timestamp <= global_clock)
             for val in values:
-                ready_tokens = [tok for tok in place_marking.tokens if
-                                tok.value == val and tok.timestamp <= marking.global_clock]
-                if len(ready_tokens) < values.count(val):
+                if place_marking.count_ready(val, marking.global_clock) < values.count(val):
                     return False
         return True
 
-    def _find_binding(self, t: Transition, marking: Marking, context: EvaluationContext) -> Optional[Dict[str, Any]]:
-        variables = t.variables
-        input_arcs = self.get_input_arcs(t)
-
-        # Gather candidate tokens from input places that are ready
-        token_pool = []
-        for arc in input_arcs:
-            place_tokens = marking.get_multiset(arc.source.name).tokens
-            candidate_tokens = [tok for tok in place_tokens if tok.timestamp <= marking.global_clock]
-            token_pool.extend(candidate_tokens)
-
-        return self._backtrack_binding(variables, token_pool, context, t, marking, {}, set())
-
-    def _backtrack_binding(self, variables: List[str], token_pool: List[Token], context: EvaluationContext,
-                           t: Transition, marking: Marking, partial_binding: Dict[str, Any],
-                           used_indices: set) -> Optional[Dict[str, Any]]:
-        if not variables:
-            # Check if this binding actually enables the transition
-            if self._check_enabled_with_binding(t, marking, context, partial_binding):
-                return partial_binding
-            return None
-
-        var = variables[0]
-        for i, tok in enumerate(token_pool):
-            if i in used_indices:
-                continue
-            # Try assigning tok.value to var
-            new_binding = dict(partial_binding)
-            new_binding[var] = tok.value
-            used_indices.add(i)
-            res = self._backtrack_binding(variables[1:], token_pool, context, t, marking, new_binding, used_indices)
-            if res is not None:
-                return res
-            used_indices.remove(i)
-        return None
-
-    def _find_all_bindings(self, t: Transition, marking: Marking, context: EvaluationContext) -> List[Dict[str, Any]]:
-        variables = t.variables
+    def _get_binding_plan(self, t: Transition) -> BindingPlan:
         input_arcs = self.get_input_arcs(t)
+        signature = plan_signature(t, input_arcs)
+        cached = self._binding_plans.get(t)
+        if cached is None or cached[0] != signature:
+            plan = BindingPlan(t.variables, [(a.source.name, a.expression) for a in input_arcs], t.guard_expr)
+            cached = self._binding_plans[t] = (signature, plan)
+        return cached[1]
+
+    def iter_bindings(self, t: Transition, marking: Marking, context: EvaluationContext,
+                      limit: Optional[int] = None, rng: Any = None,
+                      predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yield the enabled bindings of t in the marking, each one once. Nothing is materialised,
+        so a caller can stop after the first few candidates.
+
+        limit: stop after this number of bindings.
+        rng: object with a shuffle(list) method (random.Random, numpy.random.Generator); if given, the
+             candidate values are explored in random order.
+        predicate: only the bindings for which predicate(binding) is true are yielded (and counted for limit).
+
+        The marking may be modified (e.g. by firing) between two bindings: the search then goes on in the
+        modified marking, and every yielded binding is enabled in the marking as it is when it is yielded.
+        """
+        bindings = self._get_binding_plan(t).iter_bindings(self, t, marking, context, rng=rng)
+        if predicate is not None:
+            bindings = (b for b in bindings if predicate(b))
+        if limit is not None:
+            bindings = itertools.islice(bindings, limit)
+        return bindings
 
-        # Gather candidate tokens from input places that are ready
-        token_pool = []
-        for arc in input_arcs:
-            place_tokens = marking.get_multiset(arc.source.name).tokens
-            candidate_tokens = [tok for tok in place_tokens if tok.timestamp <= marking.global_clock]
-            token_pool.extend(candidate_tokens)
-
-        solutions = []
-        self._backtrack_all_bindings(variables, token_pool, context, t, marking, {}, set(), solutions)
-        return solutions
-
-    def _backtrack_all_bindings(self, variables: List[str], token_pool: List[Token], context: EvaluationContext,
-                                t: Transition, marking: Marking, partial_binding: Dict[str, Any],
-                                used_indices: set, solutions: List[Dict[str, Any]]):
-        if not variables:
-            # Check if this binding actually enables the transition
-            if self._check_enabled_with_binding(t, marking, context, partial_binding):
-                solutions.append(dict(partial_binding))
-            return
+    def _find_binding(self, t: Transition, marking: Marking, context: EvaluationContext) -> Optional[Dict[str, Any]]:
+        return next(self.iter_bindings(t, marking, context), None)
+
+    def _find_all_bindings(self, t: Transition, marking: Marking, context: EvaluationContext,
+                           with_multiplicity: bool = False) -> List[Any]:
+        """
+        All the enabled bindings of t, each returned once (bindings range over distinct token values).
+        With with_multiplicity=True, returns (binding, multiplicity) pairs, where multiplicity is the number
+        of different combinations of ready token instances the binding can consume.
+        """
+        bindings = self.iter_bindings(t, marking, context)
+        if with_multiplicity:
+            return [(b, self._binding_multiplicity(t, marking, context, b)) for b in bindings]
+        return list(bindings)
+
+    def _binding_demand(self, t: Transition, context: EvaluationContext,
+                        binding: Dict[str, Any]) -> Dict[Tuple[str, Any], List[Any]]:
+        """Tokens consumed by t under the binding: (place name, value key) -> [value, number of tokens]."""
+        demand: Dict[Tuple[str, Any], List[Any]] = {}
+        for arc in self.get_input_arcs(t):
+            values, _ = context.evaluate_arc(arc.expression, binding)
+            for v in values:
+                entry = demand.setdefault((arc.source.name, token_value_key(v)), [v, 0])
+                entry[1] += 1
+        return demand
+
+    def _binding_multiplicity(self, t: Transition, marking: Marking, context: EvaluationContext,
+                              binding: Dict[str, Any]) -> int:
+        multiplicity = 1
+        for (place_name, _), (value, needed) in self._binding_demand(t, context, binding).items():
+            multiplicity *= _binomial(marking.get_multiset(place_name).count_ready(value, marking.global_clock), needed)
+        return multiplicity
+
+    def find_step(self, marking: Marking, context: EvaluationContext, rng: Any = None,
+                  max_size: Optional[int] = None,
+                  seeds: Optional[Iterable[Tuple[Transition, Dict[str, Any]]]] = None) -> List[Tuple[Transition, Dict[str, Any]]]:
+        """
+        Greedily build a maximal step: a list of enabled (transition, binding) elements whose combined demand
+        of ready tokens fits in the marking, so that they can all fire concurrently with fire_step.
+
+        The seeds (if any) are tried first, then the transitions in the order of the net (a random order if rng,
+        an object with a shuffle(list) method, is given) with their bindings in search order. An element is
+        added as many times as the remaining tokens allow (auto-concurrency), except for transitions without
+        input arcs, which are added once. max_size bounds the number of elements of the step.
+        """
+        clock = marking.global_clock
+        remaining: Dict[Tuple[str, Any], int] = {}
+        step: List[Tuple[Transition, Dict[str, Any]]] = []
+
+        def try_add(t: Transition, binding: Dict[str, Any], demand: Dict[Tuple[str, Any], List[Any]]) -> bool:
+            if max_size is not None and len(step) >= max_size:
+                return False
+            for token_key, (value, needed) in demand.items():
+                left = remaining.get(token_key)
+                if left is None:
+                    left = remaining[token_key] = marking.get_multiset(token_key[0]).count_ready(value, clock)
+                if left < needed:
+                    return False
+            for token_key, (_, needed) in demand.items():
+                remaining[token_key] -= needed
+            step.append((t, binding))
+            return True
 
-        var = variables[0]
-        for i, tok in enumerate(token_pool):
-            if i in used_indices:
-                continue
-            new_binding = dict(partial_binding)
-            new_binding[var] = tok.value
-            used_indices.add(i)
-            self._backtrack_all_bindings(variables[1:], token_pool, context, t, marking, new_binding, used_indices,
-                                         solutions)
-            used_indices.remove(i)
+        for t, binding in seeds or ():
+            try_add(t, binding, self._binding_demand(t, context, binding))
+
+        transitions = list(self.transitions)
+        if rng is not None:
+            rng.shuffle(transitions)
+        for t in transitions:
+            for binding in self.iter_bindings(t, marking, context, rng=rng):
+                demand = self._binding_demand(t, context, binding)
+                while try_add(t, binding, demand) and demand:
+                    pass
+                if max_size is not None and len(step) >= max_size:
+                    return step
+        return step
+
+    def fire_step(self, step: List[Tuple[Transition, Dict[str, Any]]], marking: Marking,
+                  context: EvaluationContext) -> List[Occurrence]:
+        """
+        Fire the elements of a step concurrently: all the input tokens of the step are consumed from the
+        marking, then all the output tokens are produced. Raises a RuntimeError if a guard does not hold or if
+        the combined demand does not fit in the ready tokens of the marking.
+        Returns one Occurrence per element of the step.
+        """
+        clock = marking.global_clock
+        demand: Dict[Tuple[str, Any], List[Any]] = {}
+        inputs = []
+        for t, binding in step:
+            if t.guard_expr and not context.evaluate_guard(t.guard_expr, binding):
+                raise RuntimeError(f"Transition {t.name} is not enabled under the given binding.")
+            arc_values = [(arc.source, context.evaluate_arc(arc.expression, binding)[0])
+                          for arc in self.get_input_arcs(t)]
+            for place, values in arc_values:
+                for v in values:
+                    demand.setdefault((place.name, token_value_key(v)), [v, 0])[1] += 1
+            inputs.append(arc_values)
+        for (place_name, _), (value, needed) in demand.items():
+            if marking.get_multiset(place_name).count_ready(value, clock) < needed:
+                raise RuntimeError(f"The step is not enabled: not enough tokens {value!r} in place {place_name}.")
+        # The demand fits in the tokens already present: consume everything, then produce
+        consumed = [[token for place, values in arc_values for token in self._consume(marking, place, values)]
+                    for arc_values in inputs]
+        return [Occurrence(t, binding, clock, tokens, self._produce(t, binding, marking, context))
+                for (t, binding), tokens in zip(step, consumed)]
 
     def advance_global_clock(self, marking: Marking):
-        future_ts = []
-        for ms in marking._marking.values():
-            for tok in ms.tokens:
-                if tok.timestamp > marking.global_clock:
-                    future_ts.append(tok.timestamp)
-        if future_ts:
-            marking.global_clock = min(future_ts)
+        next_ts = marking.next_timestamp()
+        if next_ts is not None:
+            marking.global_clock = next_ts
 
     def __repr__(self):
         places_str = "\n    ".join(repr(p) for p in self.places)
@@ -463,6 +926,7 @@ class CPN:
         result.places = self.places[:]
         result.transitions = self.transitions[:]
         result.arcs = self.arcs[:]
+        result._rebuild_index()
         return result
 
     def __deepcopy__(self, memo):
@@ -472,8 +936,19 @@ class CPN:
         result.places = copy.deepcopy(self.places, memo)
         result.transitions = copy.deepcopy(self.transitions, memo)
         result.arcs = copy.deepcopy(self.arcs, memo)
+        result._rebuild_index()
         return result
 
+    def __getstate__(self):
+        # The indexes are rebuilt on unpickling; the binding plans hold code objects, which cannot be pickled
+        return {"places": self.places, "transitions": self.transitions, "arcs": self.arcs}
+
+    def __setstate__(self, state):
+        self.places = state["places"]
+        self.transitions = state["transitions"]
+        self.arcs = state["arcs"]
+        self._rebuild_index()
+
 
 # -----------------------------------------------------------------------------------
 # Example Usage (Timed)
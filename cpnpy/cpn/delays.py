@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# -----------------------------------------------------------------------------------
+# Pre-sampled stochastic delays
+# -----------------------------------------------------------------------------------
+def _draw(rng: np.random.Generator, name: str, params: Dict[str, float], n: int) -> np.ndarray:
+    # Same parametrisation as scipy.stats (loc / scale / shape)
+    loc, scale = params["loc"], params["scale"]
+    if name == "norm":
+        return rng.normal(loc, scale, n)
+    if name == "uniform":
+        return loc + scale * rng.random(n)
+    if name == "expon":
+        return loc + rng.exponential(scale, n)
+    if name == "lognorm":
+        return loc + scale * rng.lognormal(0.0, params["s"], n)
+    if name == "gamma":
+        return loc + rng.gamma(params["a"], scale, n)
+    raise ValueError(f"Unsupported distribution: {name}")
+
+
+class DelaySampler:
+    """
+    Serves the delays of the arc inscriptions drawing from a distribution with literal parameters
+    (e.g. "@+norm.rvs(loc=5.0, scale=1.0)", see parse_delay_distribution) from pre-sampled NumPy buffers:
+    one buffer per distinct distribution, refilled block_size draws at a time, instead of one scipy call
+    per firing. The draws come from a NumPy Generator (seeded with seed unless rng is given), so runs with
+    the same seed are reproducible.
+
+    Set it as the delay_sampler of an EvaluationContext to use it. The context only hands it the inscriptions
+    whose distribution name resolves, in its environment, to the scipy.stats distribution itself.
+    """
+
+    def __init__(self, seed: Optional[int] = None, rng: Optional[np.random.Generator] = None, block_size: int = 4096):
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        self.block_size = block_size
+        # distribution -> [buffer, position of the next draw]
+        self._buffers: Dict[Tuple[str, Any], List[Any]] = {}
+
+    def sample(self, distribution: Tuple[str, Tuple[Tuple[str, float], ...]]) -> float:
+        entry = self._buffers.get(distribution)
+        if entry is None or entry[1] == len(entry[0]):
+            name, params = distribution
+            buffer = _draw(self.rng, name, dict(params), self.block_size).tolist()
+            entry = self._buffers[distribution] = [buffer, 0]
+        value = entry[0][entry[1]]
+        entry[1] += 1
+        return value
+
+    def get_state(self) -> Dict[Tuple[str, Any], List[Any]]:
+        """
+        The draws buffered and not served yet, per distribution. The state of rng is not included: save it
+        with the generator (the Simulator shares its own with the sampler).
+        """
+        return {distribution: entry[0][entry[1]:] for distribution, entry in self._buffers.items()}
+
+    def set_state(self, state: Dict[Tuple[str, Any], List[Any]]):
+        """Serve next the draws saved by get_state, before drawing from rng again."""
+        self._buffers = {distribution: [list(buffer), 0] for distribution, buffer in state.items()}
+
+    def reset(self, seed: Optional[int] = None, rng: Optional[np.random.Generator] = None):
+        """Drop the buffered draws and restart from a new generator."""
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        self._buffers = {}
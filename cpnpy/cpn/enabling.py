@@ -0,0 +1,123 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from cpnpy.cpn.cpn_imp import CPN, EvaluationContext, Marking, Transition
+
+
+class EnablingCache:
+    """
+    Incremental enabling information for a CPN under a marking that evolves over time.
+
+    Between two queries, only the transitions connected to places whose content changed (detected through
+    the version stamp of each place multiset) are searched again for bindings. When the global clock moves
+    forward, only the transitions whose input places hold a token that became ready in the meantime are
+    recomputed. A different marking object, a clock going backwards or a change of the net structure
+    invalidate everything.
+
+    With all_bindings=False (default) only the first binding found for each transition is kept, which is what
+    a simulator needs; with all_bindings=True every binding is kept.
+    """
+
+    def __init__(self, cpn: CPN, context: EvaluationContext, all_bindings: bool = False):
+        self.cpn = cpn
+        self.context = context
+        self.all_bindings = all_bindings
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget everything; the next query recomputes all the transitions."""
+        self._marking: Optional[Marking] = None
+        self._clock = None
+        self._structure = None
+        self._snapshots: Dict[str, Tuple[Any, int]] = {}
+        self._bindings: Dict[Transition, List[Dict[str, Any]]] = {}
+        # Smallest future token timestamp in the input places of each transition, when it was computed
+        self._valid_until: Dict[Transition, Optional[int]] = {}
+
+    def refresh(self, marking: Marking) -> Set[Transition]:
+        """
+        Bring the cache up to date with the marking. Returns the set of transitions that were recomputed.
+        """
+        structure = (len(self.cpn.places), len(self.cpn.transitions), len(self.cpn.arcs))
+        if marking is not self._marking or structure != self._structure or (
+                self._clock is not None and marking.global_clock < self._clock):
+            self.invalidate()
+            self._marking = marking
+            self._structure = structure
+
+        dirty: Set[Transition] = set()
+        for place_name in set(self._snapshots).union(marking._marking):
+            ms = marking._marking.get(place_name)
+            snapshot = (ms, ms._version) if ms is not None else (None, 0)
+            previous = self._snapshots.get(place_name)
+            if previous is None or previous[0] is not snapshot[0] or previous[1] != snapshot[1]:
+                self._snapshots[place_name] = snapshot
+                dirty.update(self.cpn.get_consumers(place_name))
+
+        clock = marking.global_clock
+        if self._clock is not None and clock > self._clock:
+            for t, valid_until in self._valid_until.items():
+                if valid_until is not None and valid_until <= clock:
+                    dirty.add(t)
+        self._clock = clock
+
+        dirty.update(t for t in self.cpn.transitions if t not in self._bindings)
+        for t in dirty:
+            self._recompute(t, marking)
+        return dirty
+
+    def _recompute(self, t: Transition, marking: Marking):
+        bindings = self.cpn.iter_bindings(t, marking, self.context)
+        if self.all_bindings:
+            self._bindings[t] = list(bindings)
+        else:
+            first = next(bindings, None)
+            self._bindings[t] = [first] if first is not None else []
+
+        valid_until = None
+        for arc in self.cpn.get_input_arcs(t):
+            ts = marking.get_multiset(arc.source.name).next_timestamp(marking.global_clock)
+            if ts is not None and (valid_until is None or ts < valid_until):
+                valid_until = ts
+        self._valid_until[t] = valid_until
+
+    def enabled_transitions(self, marking: Marking) -> List[Transition]:
+        """Transitions having at least one enabled binding, in the order of the net."""
+        self.refresh(marking)
+        return [t for t in self.cpn.transitions if self._bindings.get(t)]
+
+    def get_binding(self, t: Transition, marking: Marking) -> Optional[Dict[str, Any]]:
+        """An enabled binding of t, or None."""
+        self.refresh(marking)
+        bindings = self._bindings.get(t)
+        return bindings[0] if bindings else None
+
+    def get_bindings(self, t: Transition, marking: Marking) -> List[Dict[str, Any]]:
+        """The cached enabled bindings of t (only the first one unless all_bindings=True)."""
+        self.refresh(marking)
+        return self._bindings.get(t, [])
+
+    def get_state(self, marking: Marking) -> Dict[str, Any]:
+        """
+        Picklable state of the cache, brought up to date with the marking first. Transitions are referred to by
+        name, so that the state can be restored on another copy of the net (see set_state).
+        """
+        self.refresh(marking)
+        return {"clock": self._clock,
+                "bindings": {t.name: bindings for t, bindings in self._bindings.items()},
+                "valid_until": {t.name: valid_until for t, valid_until in self._valid_until.items()}}
+
+    def set_state(self, marking: Marking, state: Dict[str, Any]):
+        """
+        Restore a state returned by get_state, for a marking with the same content as the one it was taken on:
+        nothing is searched again until the marking changes.
+        """
+        self.invalidate()
+        self._marking = marking
+        self._structure = (len(self.cpn.places), len(self.cpn.transitions), len(self.cpn.arcs))
+        self._clock = state["clock"]
+        self._snapshots = {place_name: (ms, ms._version) for place_name, ms in marking._marking.items()}
+        for name, bindings in state["bindings"].items():
+            t = self.cpn.get_transition_by_name(name)
+            if t is not None:
+                self._bindings[t] = bindings
+                self._valid_until[t] = state["valid_until"][name]
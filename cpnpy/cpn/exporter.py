@@ -245,8 +245,9 @@ def export_cpn_to_json(
             continue
 
         # Extract tokens and timestamps correctly from Multiset
-        tokens = [tok.value for tok in ms.tokens]
-        timestamps = [tok.timestamp for tok in ms.tokens]
+        ms_tokens = ms.tokens
+        tokens = [tok.value for tok in ms_tokens]
+        timestamps = [tok.timestamp for tok in ms_tokens]
 
         # Only include timestamps if the place's colorset is timed OR if any token has a non-zero timestamp
         include_timestamps = place.colorset.timed or any(ts != 0 for ts in timestamps)
@@ -0,0 +1,93 @@
+import ast
+from types import CodeType
+from typing import Any, Optional, Tuple
+
+
+# -----------------------------------------------------------------------------------
+# Compilation of guards and arc inscriptions
+# -----------------------------------------------------------------------------------
+DELAY_SEPARATOR = "@+"
+
+
+def split_arc_expression(arc_expr: str) -> Tuple[str, Optional[str]]:
+    """
+    Split an arc inscription into its value part and its (optional) delay part.
+    Example: "(x, 'hello') @+5" -> ("(x, 'hello')", "5"); "x" -> ("x", None)
+    """
+    if DELAY_SEPARATOR in arc_expr:
+        parts = arc_expr.split(DELAY_SEPARATOR)
+        return parts[0].strip(), parts[1].strip()
+    return arc_expr.strip(), None
+
+
+def compile_expression(expr: str, filename: str = "<expression>") -> CodeType:
+    """
+    Compile a Python expression once, so that it can be evaluated many times with eval().
+    """
+    return compile(expr.strip(), filename, "eval")
+
+
+# Distributions of scipy.stats recognised in delay inscriptions, with their parameters and default values
+DELAY_DISTRIBUTIONS = {
+    "norm": {"loc": 0.0, "scale": 1.0},
+    "uniform": {"loc": 0.0, "scale": 1.0},
+    "expon": {"loc": 0.0, "scale": 1.0},
+    "lognorm": {"s": None, "loc": 0.0, "scale": 1.0},
+    "gamma": {"a": None, "loc": 0.0, "scale": 1.0},
+}
+
+
+def _number(node: ast.AST) -> Optional[float]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _number(node.operand)
+        if value is not None:
+            return -value if isinstance(node.op, ast.USub) else value
+    return None
+
+
+def parse_delay_distribution(delay_source: str) -> Optional[Tuple[str, Tuple[Tuple[str, float], ...]]]:
+    """
+    Recognise a delay inscription drawing from a distribution with literal parameters, as produced by
+    cpnpy.util.rv_to_stri, e.g. "norm.rvs(loc=5.0, scale=1.0)" -> ("norm", (("loc", 5.0), ("scale", 1.0))).
+    Missing parameters get their scipy default. Returns None for any other expression.
+    """
+    try:
+        node = ast.parse(delay_source.strip(), mode="eval").body
+    except SyntaxError:
+        return None
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "rvs"
+            and isinstance(node.func.value, ast.Name) and node.func.value.id in DELAY_DISTRIBUTIONS
+            and not node.args):
+        return None
+    name = node.func.value.id
+    params = dict(DELAY_DISTRIBUTIONS[name])
+    for keyword in node.keywords:
+        value = _number(keyword.value)
+        if keyword.arg not in params or value is None:
+            return None
+        params[keyword.arg] = value
+    if any(value is None for value in params.values()):
+        return None
+    return name, tuple(sorted(params.items()))
+
+
+class CompiledArcExpression:
+    """
+    Arc inscription parsed once: the value part and the delay part are compiled separately.
+    delay_code is None when the inscription has no '@+' delay; delay_distribution is the parsed
+    distribution of the delay (see parse_delay_distribution), or None.
+    """
+    __slots__ = ("expression", "value_source", "delay_source", "value_code", "delay_code", "delay_distribution")
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.value_source, self.delay_source = split_arc_expression(expression)
+        self.value_code = compile_expression(self.value_source, "<arc>")
+        self.delay_code = compile_expression(self.delay_source, "<arc delay>") if self.delay_source is not None else None
+        self.delay_distribution: Optional[Tuple[str, Any]] = (
+            parse_delay_distribution(self.delay_source) if self.delay_source is not None else None)
+
+    def __repr__(self):
+        return f"CompiledArcExpression({self.expression!r})"
@@ -80,6 +80,9 @@ def import_cpn_from_json(data: Dict[str, Any]) -> (CPN, Marking, EvaluationConte
             # (User could adapt this logic as needed)
             context = EvaluationContext(str(eval_context_data))
 
+    # Parse guards and arc inscriptions once, instead of at their first evaluation
+    context.compile_net(cpn)
+
     return cpn, marking, context
 
 
@@ -1,5 +1,7 @@
 import streamlit as st
+from typing import Optional
 from cpnpy.cpn.cpn_imp import CPN, Marking, EvaluationContext, Transition
+from cpnpy.cpn.enabling import EnablingCache
 
 
 def step_transition(cpn: CPN, transition_name: str, marking: Marking, context: EvaluationContext):
@@ -30,12 +32,13 @@ def advance_clock(cpn: CPN, marking: Marking):
         st.success(f"Advanced global clock from {old_time} to {new_time}.")
 
 
-def get_enabled_transitions(cpn: CPN, marking: Marking, context: EvaluationContext):
+def get_enabled_transitions(cpn: CPN, marking: Marking, context: EvaluationContext,
+                            cache: Optional[EnablingCache] = None):
     """
     Return a list of currently enabled transitions' names.
+    If an EnablingCache is provided (and kept across calls), only the transitions affected by the changes
+    since the previous call are checked again.
     """
-    enabled = []
-    for t in cpn.transitions:
-        if cpn.is_enabled(t, marking, context):
-            enabled.append(t.name)
-    return enabled
+    if cache is None:
+        cache = EnablingCache(cpn, context)
+    return [t.name for t in cache.enabled_transitions(marking)]
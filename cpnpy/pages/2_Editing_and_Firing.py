@@ -36,6 +36,7 @@ def parse_binding_to_dict(binding_str: str) -> dict:
 
 # 3) Import your Petri net modules
 from cpnpy.cpn.cpn_imp import Place, Transition, Arc
+from cpnpy.cpn.enabling import EnablingCache
 from cpnpy.interface.draw import draw_cpn
 from cpnpy.interface.simulation import (
     step_transition,
@@ -216,7 +217,11 @@ with st.expander("Marking Details", expanded=False):
 
 # Simulation
 st.subheader("Simulation Controls")
-enabled_list = get_enabled_transitions(cpn, marking, context)
+cache = st.session_state.get("enabling_cache")
+if cache is None or cache.cpn is not cpn or cache.context is not context:
+    cache = EnablingCache(cpn, context)
+    st.session_state["enabling_cache"] = cache
+enabled_list = get_enabled_transitions(cpn, marking, context, cache=cache)
 if enabled_list:
     st.write("**Enabled transitions** (with any valid binding):", enabled_list)
     chosen_transition = st.selectbox("Choose a transition to fire", enabled_list, key="fire_transition_select")
@@ -1,129 +1,126 @@
+from array import array
 from cpnpy.cpn.cpn_imp import *
-import copy
+from cpnpy.simulation.simulator import Simulator, SimulationSink, SimulationEvent
+from cpnpy.simulation.sinks import event_objects
+import numpy as np
 import pandas as pd
-import random
 from pm4py.objects.ocel.obj import OCEL
 
 
-def simulate_cpn_to_ocel(cpn: CPN, initial_marking: Marking, context: EvaluationContext) -> OCEL:
+class OCELSink(SimulationSink):
     """
-    Simulate the given CPN starting from the given initial marking, and return an OCEL object.
-    Each fired transition is recorded as an event.
+    Simulation sink building an OCEL object: each fired transition is recorded as an event.
     Input and output tokens for each event are considered as related objects.
     The object type is derived from the place's color set.
+    The OCEL is available in self.ocel once the simulation is finished.
+
+    Events and relations are accumulated in typed columnar buffers (clock, event counter, activity code, object
+    index); the dataframes, including the timestamps, are built once and vectorized at the end of the run.
     """
-    marking = copy.deepcopy(initial_marking)
-
-    # Data structures to build the OCEL
-    event_list = []
-    object_set = set()
-    relation_list = []
-
-    event_counter = 1
-
-    # Helper to safely get object ID as a hashable value (stringify if necessary)
-    def make_object_id(value):
-        return str(value)
-
-    # Helper to determine object type from a place's color set
-    def get_object_type_from_colorset(place):
-        return place.colorset.name
-
-    # Run simulation until no transition is enabled
-    while True:
-        enabled_transitions = []
-        # Check which transitions are enabled
-        transitions = list(cpn.transitions)
-        random.shuffle(transitions)
-        for t in transitions:
-            if cpn.is_enabled(t, marking, context):
-                enabled_transitions.append(t)
-
-        if not enabled_transitions:
-            # No transitions enabled, try to advance time
-            old_clock = marking.global_clock
-            cpn.advance_global_clock(marking)
-            if marking.global_clock == old_clock:
-                # No advancement in time means we are done
-                break
-            else:
-                # After advancing clock, check again
-                continue
-
-        # Fire an arbitrary enabled transition
-        t = enabled_transitions[0]
-
-        # Determine the actual binding used to fire
-        binding = cpn._find_binding(t, marking, context)
-        if binding is None:
-            # If no binding found, skip (should be rare)
-            break
-
-        # Add a minuscule increment (1 microsecond per event) to the event timestamp
-        event_timestamp = pd.to_datetime(marking.global_clock, unit='s', utc=True) + pd.to_timedelta(event_counter,
-                                                                                                     unit='us')
-
-        # The activity is the transition name
-        activity = t.name
+
+    def __init__(self):
+        self.ocel: Optional[OCEL] = None
+        self._reset()
+
+    def _reset(self):
+        # Interned activities and (oid, otype) objects: value -> code
+        self._activities: Dict[str, int] = {}
+        self._objects: Dict[Tuple[str, str], int] = {}
+        # One entry per event
+        self._event_clock = array("d")
+        self._event_index = array("q")
+        self._event_activity = array("q")
+        # One entry per event-object relation: position of the event in the event buffers, object code
+        self._relation_event = array("q")
+        self._relation_object = array("q")
+
+    def on_start(self, simulator: Simulator):
+        self.ocel = None
+        self._reset()
+
+    def on_event(self, simulator: Simulator, event: SimulationEvent):
+        position = len(self._event_index)
+        activity = event.transition.name
+        code = self._activities.get(activity)
+        if code is None:
+            code = self._activities[activity] = len(self._activities)
+        self._event_clock.append(event.clock)
+        self._event_index.append(event.index)
+        self._event_activity.append(code)
 
         # Identify related objects from input and output arcs
-        related_objects = set()
-
-        # For input arcs
-        for arc in cpn.get_input_arcs(t):
-            values, _ = context.evaluate_arc(arc.expression, binding)
-            otype = get_object_type_from_colorset(arc.source)  # derive from source place's color set
-            for v in values:
-                obj_id = make_object_id(v)
-                related_objects.add((obj_id, otype))
-
-        # Fire transition (this will modify the marking)
-        cpn.fire_transition(t, marking, context, binding)
-
-        # For output arcs
-        for arc in cpn.get_output_arcs(t):
-            values, arc_delay = context.evaluate_arc(arc.expression, binding)
-            otype = get_object_type_from_colorset(arc.target)  # derive from target place's color set
-            for v in values:
-                obj_id = make_object_id(v)
-                related_objects.add((obj_id, otype))
-
-        # Event ID
-        eid = f"e_{event_counter}"
-        event_counter += 1
-
-        # Add event to event_list
-        event_list.append({
-            "ocel:eid": eid,
-            "ocel:activity": activity,
-            "ocel:timestamp": event_timestamp
+        for obj in event_objects(simulator, event):
+            obj_code = self._objects.get(obj)
+            if obj_code is None:
+                obj_code = self._objects[obj] = len(self._objects)
+            self._relation_event.append(position)
+            self._relation_object.append(obj_code)
+
+    def get_state(self, simulator: Simulator):
+        return {"activities": self._activities, "objects": self._objects,
+                "buffers": [buffer.tobytes() for buffer in self._buffers()]}
+
+    def set_state(self, simulator: Simulator, state):
+        self.ocel = None
+        self._reset()
+        self._activities = dict(state["activities"])
+        self._objects = dict(state["objects"])
+        for buffer, data in zip(self._buffers(), state["buffers"]):
+            buffer.frombytes(data)
+
+    def _buffers(self):
+        return [self._event_clock, self._event_index, self._event_activity, self._relation_event,
+                self._relation_object]
+
+    def on_finish(self, simulator: Simulator):
+        index = np.asarray(self._event_index, dtype=np.int64)
+        # The clock in seconds, plus a minuscule increment (1 microsecond per event), converted in one go
+        timestamps = pd.to_datetime(np.asarray(self._event_clock, dtype=np.float64), unit='s', utc=True) + \
+            pd.to_timedelta(index, unit='us')
+        eids = np.array([f"e_{i}" for i in self._event_index], dtype=object)
+        activities = np.array(list(self._activities), dtype=object)[np.asarray(self._event_activity, dtype=np.int64)]
+        oids = np.array([oid for oid, _ in self._objects], dtype=object)
+        otypes = np.array([otype for _, otype in self._objects], dtype=object)
+        relation_event = np.asarray(self._relation_event, dtype=np.int64)
+        relation_object = np.asarray(self._relation_object, dtype=np.int64)
+
+        # Create dataframes
+        events_df = pd.DataFrame({
+            "ocel:eid": eids,
+            "ocel:activity": activities,
+            "ocel:timestamp": timestamps
+        })
+        objects_df = pd.DataFrame({
+            "ocel:oid": oids,
+            "ocel:type": otypes
+        })
+        relations_df = pd.DataFrame({
+            "ocel:eid": eids[relation_event],
+            "ocel:activity": activities[relation_event],
+            "ocel:timestamp": timestamps[relation_event],
+            "ocel:oid": oids[relation_object],
+            "ocel:type": otypes[relation_object],
+            "ocel:qualifier": None
         })
 
-        # Add objects and relations
-        for (oid, otype) in related_objects:
-            object_set.add((oid, otype))
-            relation_list.append({
-                "ocel:eid": eid,
-                "ocel:activity": activity,
-                "ocel:timestamp": event_timestamp,
-                "ocel:oid": oid,
-                "ocel:type": otype,
-                "ocel:qualifier": None
-            })
-
-    # Create dataframes
-    events_df = pd.DataFrame(event_list)
-    objects_df = pd.DataFrame([
-        {"ocel:oid": oid, "ocel:type": otype}
-        for (oid, otype) in object_set
-    ])
-    relations_df = pd.DataFrame(relation_list)
-
-    # Create OCEL object
-    ocel = OCEL(
-        events=events_df,
-        objects=objects_df,
-        relations=relations_df
-    )
-
-    return ocel
+        # Create OCEL object
+        self.ocel = OCEL(
+            events=events_df,
+            objects=objects_df,
+            relations=relations_df
+        )
+
+
+def simulate_cpn_to_ocel(cpn: CPN, initial_marking: Marking, context: EvaluationContext,
+                         step_semantics: bool = False, seed: Optional[int] = None) -> OCEL:
+    """
+    Simulate the given CPN starting from the given initial marking, until no transition can fire anymore,
+    and return an OCEL object (see OCELSink).
+    With step_semantics=True, every iteration fires a maximal step of non-conflicting bindings (see
+    CPN.find_step) instead of a single one; its events share the same clock value.
+    All the random choices come from a NumPy Generator seeded with seed (see Simulator): the same seed gives
+    the same log.
+    """
+    sink = OCELSink()
+    Simulator(cpn, initial_marking, context, seed=seed, sinks=[sink], step_semantics=step_semantics).run()
+    return sink.ocel
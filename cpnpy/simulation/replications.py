@@ -0,0 +1,159 @@
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cpnpy.cpn.cpn_imp import CPN, EvaluationContext, Marking
+from cpnpy.simulation.simulator import Simulator, SimulationSink, SimulationEvent
+import numpy as np
+
+
+# -----------------------------------------------------------------------------------
+# Results
+# -----------------------------------------------------------------------------------
+class ReplicationResult:
+    """
+    Outcome of one replication. kpis is the dictionary returned by the kpi function (empty if none was given);
+    ocel is only set when the OCELs were requested.
+    """
+    __slots__ = ("index", "seed", "event_count", "activity_counts", "final_clock", "termination", "kpis", "ocel")
+
+    def __init__(self, index: int, seed: np.random.SeedSequence, event_count: int, activity_counts: Dict[str, int],
+                 final_clock: int, termination: Optional[str], kpis: Dict[str, float], ocel: Any = None):
+        self.index = index
+        self.seed = seed
+        self.event_count = event_count
+        self.activity_counts = activity_counts
+        self.final_clock = final_clock
+        self.termination = termination
+        self.kpis = kpis
+        self.ocel = ocel
+
+    def __repr__(self):
+        return (f"ReplicationResult({self.index}, stream={self.seed.spawn_key}, events={self.event_count}, "
+                f"clock={self.final_clock}, {self.termination})")
+
+
+class ReplicationResults:
+    """
+    Merged results of a set of replications, ordered by replication index.
+    """
+
+    def __init__(self, results: List[ReplicationResult]):
+        self.results = sorted(results, key=lambda r: r.index)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    @property
+    def event_counts(self) -> List[int]:
+        return [r.event_count for r in self.results]
+
+    def activity_counts(self) -> Dict[str, int]:
+        """Number of occurrences of every transition, summed over the replications."""
+        total: Dict[str, int] = {}
+        for r in self.results:
+            for activity, count in r.activity_counts.items():
+                total[activity] = total.get(activity, 0) + count
+        return total
+
+    def kpi_summary(self) -> Dict[str, Dict[str, float]]:
+        """Mean, standard deviation, minimum and maximum of every KPI over the replications reporting it."""
+        values: Dict[str, List[float]] = {}
+        for r in self.results:
+            for name, value in r.kpis.items():
+                values.setdefault(name, []).append(value)
+        return {name: {"mean": sum(vs) / len(vs),
+                       "stdev": statistics.stdev(vs) if len(vs) > 1 else 0.0,
+                       "min": min(vs),
+                       "max": max(vs),
+                       "n": len(vs)}
+                for name, vs in values.items()}
+
+    def ocels(self) -> List[Any]:
+        return [r.ocel for r in self.results if r.ocel is not None]
+
+
+# -----------------------------------------------------------------------------------
+# Workers
+# -----------------------------------------------------------------------------------
+class _ActivityCountSink(SimulationSink):
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    def on_event(self, simulator: Simulator, event: SimulationEvent):
+        name = event.transition.name
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+# Net, initial marking, context and options of the replications, sent once to every worker process
+_worker_setup: Optional[Tuple[CPN, Marking, EvaluationContext, Dict[str, Any]]] = None
+
+
+def _init_worker(cpn: CPN, initial_marking: Marking, context: EvaluationContext, options: Dict[str, Any]):
+    global _worker_setup
+    _worker_setup = (cpn, initial_marking, context, options)
+
+
+def _run_replication(index: int, seed: np.random.SeedSequence) -> ReplicationResult:
+    cpn, initial_marking, context, options = _worker_setup
+    counter = _ActivityCountSink()
+    sinks: List[SimulationSink] = [counter]
+    ocel_sink = None
+    if options["collect_ocel"]:
+        from cpnpy.simulation.ocel_simu import OCELSink
+        ocel_sink = OCELSink()
+        sinks.append(ocel_sink)
+
+    simulator = Simulator(cpn, initial_marking, context, seed=seed, sinks=sinks,
+                          step_semantics=options["step_semantics"], random_binding=options["random_binding"])
+    simulator.run(max_steps=options["max_steps"], max_clock=options["max_clock"])
+    kpis = options["kpi"](simulator) if options["kpi"] is not None else {}
+    return ReplicationResult(index, seed, simulator.event_count, counter.counts, simulator.clock,
+                             simulator.termination, kpis, ocel_sink.ocel if ocel_sink is not None else None)
+
+
+# -----------------------------------------------------------------------------------
+# Runner
+# -----------------------------------------------------------------------------------
+def run_replications(cpn: CPN, initial_marking: Marking, context: EvaluationContext, n_replications: int,
+                     seed: Optional[int] = None, max_workers: Optional[int] = None,
+                     max_steps: Optional[int] = None, max_clock: Optional[int] = None,
+                     kpi: Optional[Callable[[Simulator], Dict[str, float]]] = None,
+                     collect_ocel: bool = False, step_semantics: bool = False,
+                     random_binding: bool = False) -> ReplicationResults:
+    """
+    Run n_replications independent simulations of the net over a ProcessPoolExecutor.
+
+    Every replication gets its own independent random stream, spawned from numpy.random.SeedSequence(seed), so
+    that the whole set is reproducible whatever the number of workers and the order of completion. The net,
+    the initial marking and the context are pickled once per worker process (the context is rebuilt there by
+    re-executing its user code); the tasks themselves only carry a replication index and a seed.
+    Each replication returns its event count, the occurrences of every transition, the final clock, the
+    termination reason, the KPIs computed by kpi(simulator) at the end of the run (kpi must be picklable,
+    e.g. a module-level function) and, with collect_ocel=True, its OCEL.
+
+    max_workers=0 runs the replications sequentially in the current process.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(n_replications)
+    options = {"max_steps": max_steps, "max_clock": max_clock, "kpi": kpi, "collect_ocel": collect_ocel,
+               "step_semantics": step_semantics, "random_binding": random_binding}
+    setup = (cpn, initial_marking, context, options)
+
+    if max_workers == 0:
+        global _worker_setup
+        previous, _worker_setup = _worker_setup, setup
+        try:
+            results = [_run_replication(i, s) for i, s in enumerate(seeds)]
+        finally:
+            _worker_setup = previous
+        return ReplicationResults(results)
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=setup) as executor:
+        # Several replications per task, to limit the number of round trips
+        chunksize = max(1, n_replications // (4 * (max_workers or os.cpu_count() or 1)))
+        results = list(executor.map(_run_replication, range(n_replications), seeds, chunksize=chunksize))
+    return ReplicationResults(results)
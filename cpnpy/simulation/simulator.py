@@ -0,0 +1,287 @@
+import copy
+import pickle
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from cpnpy.cpn.cpn_imp import CPN, EvaluationContext, Marking, Multiset, Occurrence, Transition
+from cpnpy.cpn.enabling import EnablingCache
+from cpnpy.cpn.delays import DelaySampler
+import numpy as np
+
+
+# -----------------------------------------------------------------------------------
+# Events and sinks
+# -----------------------------------------------------------------------------------
+class SimulationEvent:
+    """
+    Occurrence of a binding element during a simulation.
+    index: 1-based position of the event in the run; clock: global clock when the element fired;
+    occurrence: the tokens consumed and produced by the firing (see CPN.fire_transition).
+    """
+    __slots__ = ("index", "clock", "transition", "binding", "occurrence")
+
+    def __init__(self, index: int, clock: int, transition: Transition, binding: Dict[str, Any],
+                 occurrence: Occurrence):
+        self.index = index
+        self.clock = clock
+        self.transition = transition
+        self.binding = binding
+        self.occurrence = occurrence
+
+    def __repr__(self):
+        return f"SimulationEvent({self.index}, t={self.clock}, {self.transition.name}, {self.binding})"
+
+
+class SimulationSink:
+    """
+    Output of a Simulator. The hooks do nothing by default; subclasses override the ones they need.
+    """
+
+    def on_start(self, simulator: "Simulator"):
+        pass
+
+    def on_event(self, simulator: "Simulator", event: SimulationEvent):
+        pass
+
+    def on_finish(self, simulator: "Simulator"):
+        pass
+
+    def get_state(self, simulator: "Simulator") -> Any:
+        """
+        Picklable state of the sink (e.g. its position in its output), saved in the checkpoints of the simulator.
+        Sinks keeping no state return None.
+        """
+        return None
+
+    def set_state(self, simulator: "Simulator", state: Any):
+        """
+        Restore a state returned by get_state when a simulation is resumed from a checkpoint; it replaces on_start.
+        """
+        pass
+
+
+# -----------------------------------------------------------------------------------
+# Simulator
+# -----------------------------------------------------------------------------------
+CHECKPOINT_MAGIC = b"CPNPYSIM1"
+
+
+class Simulator:
+    """
+    Discrete-event simulator of a CPN.
+
+    Enabled bindings come from an EnablingCache, so that a single binding search is done per fired element and
+    only the transitions affected by the last firing are searched again. When nothing is enabled, the clock jumps
+    to the next token timestamp: the event calendar is the heap of future timestamps kept by every place.
+
+    All the randomness of a run comes from one NumPy Generator, rng, built from seed (an int or a
+    numpy.random.SeedSequence, e.g. one of the streams spawned for a set of replications) unless given: the
+    choice of the enabled transition that fires, the choice of its binding (random_binding=True; otherwise the
+    first binding found is used), the order in which a step is grown, and the delays drawn from a distribution
+    (sample_delays=True: the simulator works on a copy of the context with a DelaySampler drawing from rng).
+    The same seed therefore reproduces the same run.
+
+    Every fired element is reported to the sinks as a SimulationEvent.
+    With step_semantics=True, every iteration fires a maximal step of non-conflicting bindings (CPN.find_step).
+    """
+
+    def __init__(self, cpn: CPN, initial_marking: Marking, context: EvaluationContext, seed: Any = None,
+                 rng: Optional[np.random.Generator] = None, sinks: Optional[List[SimulationSink]] = None,
+                 step_semantics: bool = False, random_binding: bool = False, sample_delays: bool = True):
+        self.cpn = cpn
+        self.marking = copy.deepcopy(initial_marking)
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        if sample_delays:
+            context = copy.copy(context)
+            context.delay_sampler = DelaySampler(rng=self.rng)
+        self.context = context
+        self.random_binding = random_binding
+        self.sinks: List[SimulationSink] = list(sinks) if sinks else []
+        self.step_semantics = step_semantics
+        self.sample_delays = sample_delays
+        self.event_count = 0
+        # Whether on_start has been sent to the sinks (also true for a simulation resumed from a checkpoint)
+        self._started = False
+        # Why the last run stopped: "dead", "max_steps", "max_clock" or "predicate"
+        self.termination: Optional[str] = None
+        context.compile_net(cpn)
+        self.enabling_cache = EnablingCache(cpn, context)
+
+    def add_sink(self, sink: SimulationSink):
+        self.sinks.append(sink)
+
+    @property
+    def clock(self) -> int:
+        return self.marking.global_clock
+
+    def next_event_time(self) -> Optional[int]:
+        """Clock of the next firing: the current clock if something is enabled, else the next token timestamp."""
+        if self.enabling_cache.enabled_transitions(self.marking):
+            return self.marking.global_clock
+        return self.marking.next_timestamp()
+
+    def step(self, max_clock: Optional[int] = None) -> List[SimulationEvent]:
+        """
+        Fire one binding element (or one maximal step), advancing the clock first if nothing is enabled.
+        Returns the events fired; an empty list means that the net is dead, or that the next firing would happen
+        after max_clock (the clock is then left unchanged).
+        """
+        enabled = self.enabling_cache.enabled_transitions(self.marking)
+        while not enabled:
+            next_ts = self.marking.next_timestamp()
+            if next_ts is None or (max_clock is not None and next_ts > max_clock):
+                return []
+            self.marking.global_clock = next_ts
+            enabled = self.enabling_cache.enabled_transitions(self.marking)
+
+        if self.step_semantics:
+            elements = self.cpn.find_step(self.marking, self.context, rng=self.rng)
+            occurrences = self.cpn.fire_step(elements, self.marking, self.context)
+        else:
+            t = enabled[self.rng.integers(len(enabled))]
+            if self.random_binding:
+                binding = next(self.cpn.iter_bindings(t, self.marking, self.context, rng=self.rng))
+            else:
+                binding = self.enabling_cache.get_binding(t, self.marking)
+            occurrences = [self.cpn.fire_transition(t, self.marking, self.context, binding)]
+
+        events = []
+        for occurrence in occurrences:
+            self.event_count += 1
+            event = SimulationEvent(self.event_count, occurrence.clock, occurrence.transition, occurrence.binding,
+                                    occurrence)
+            for sink in self.sinks:
+                sink.on_event(self, event)
+            events.append(event)
+        return events
+
+    def iter_events(self, max_steps: Optional[int] = None, max_clock: Optional[int] = None,
+                    until: Optional[Callable[["Simulator"], bool]] = None) -> Iterator[SimulationEvent]:
+        """
+        Run the simulation lazily, yielding every event as it is fired (the sinks are notified as well).
+        It stops when the net is dead or a stop criterion is met: max_steps fired events, no firing possible
+        before max_clock, or until(simulator) returning True (checked after every firing).
+        The reason is stored in self.termination.
+        """
+        if not self._started:
+            for sink in self.sinks:
+                sink.on_start(self)
+            self._started = True
+        self.termination = None
+        steps = 0
+        while self.termination is None:
+            if max_steps is not None and steps >= max_steps:
+                self.termination = "max_steps"
+                break
+            events = self.step(max_clock=max_clock)
+            if not events:
+                # Nothing fired: either no token will ever become ready, or the next one is after max_clock
+                self.termination = "dead" if self.marking.next_timestamp() is None else "max_clock"
+                break
+            steps += len(events)
+            yield from events
+            if until is not None and until(self):
+                self.termination = "predicate"
+        for sink in self.sinks:
+            sink.on_finish(self)
+
+    def run(self, max_steps: Optional[int] = None, max_clock: Optional[int] = None,
+            until: Optional[Callable[["Simulator"], bool]] = None) -> "Simulator":
+        """
+        Run the simulation to the end (see iter_events for the stop criteria), feeding the sinks only.
+        """
+        for _ in self.iter_events(max_steps=max_steps, max_clock=max_clock, until=until):
+            pass
+        return self
+
+    # -----------------------------------------------------------------------------------
+    # Checkpoints
+    # -----------------------------------------------------------------------------------
+    def checkpoint(self, include_sinks: bool = True) -> bytes:
+        """
+        Snapshot of the running simulation as compact bytes (zlib-compressed pickle of plain data, not of the
+        objects): the marking and its clock, the state of the random generator and of the pre-sampled delays,
+        the enabling cache and, unless include_sinks is False, the state of every sink (see SimulationSink.get_state).
+        Simulator.restore resumes exactly from it. It can be taken between two events, e.g. inside a loop over
+        iter_events.
+        """
+        sampler = self.context.delay_sampler if self.sample_delays else None
+        state = {
+            "marking": (self.marking.global_clock,
+                        [(place_name, [(value, list(timestamps)) for value, timestamps in ms.items()])
+                         for place_name, ms in self.marking._marking.items()]),
+            "rng": self.rng.bit_generator.state,
+            "delays": sampler.get_state() if sampler is not None else None,
+            "enabling": self.enabling_cache.get_state(self.marking),
+            "event_count": self.event_count,
+            "started": self._started,
+            "options": {"step_semantics": self.step_semantics, "random_binding": self.random_binding,
+                        "sample_delays": self.sample_delays},
+            "sinks": [sink.get_state(self) for sink in self.sinks] if include_sinks else None,
+        }
+        return CHECKPOINT_MAGIC + zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def save_checkpoint(self, path: str, include_sinks: bool = True):
+        with open(path, "wb") as f:
+            f.write(self.checkpoint(include_sinks=include_sinks))
+
+    @classmethod
+    def restore(cls, data: bytes, cpn: CPN, context: EvaluationContext,
+                sinks: Optional[List[SimulationSink]] = None, seed: Any = None) -> "Simulator":
+        """
+        Resume a simulation from a checkpoint, on the same net and context it was taken with. The sinks must be
+        configured as the checkpointed ones (same kind and order) and are given their saved state; when the
+        checkpoint holds no sink state (or sinks is None), the given sinks start from scratch.
+        If a seed is given, the random generator is reseeded instead of restored, e.g. to fork a what-if
+        scenario from a shared prefix.
+        """
+        if not data.startswith(CHECKPOINT_MAGIC):
+            raise ValueError("Not a simulation checkpoint.")
+        state = pickle.loads(zlib.decompress(data[len(CHECKPOINT_MAGIC):]))
+
+        marking = Marking()
+        marking.global_clock, places = state["marking"]
+        for place_name, entries in places:
+            ms = marking._marking[place_name] = Multiset()
+            for value, timestamps in entries:
+                for ts in timestamps:
+                    ms.add(value, timestamp=ts)
+
+        if seed is None:
+            bit_generator = getattr(np.random, state["rng"]["bit_generator"])()
+            bit_generator.state = state["rng"]
+            rng = np.random.Generator(bit_generator)
+        else:
+            rng = np.random.default_rng(seed)
+
+        options = state["options"]
+        simulator = cls(cpn, Marking(), context, rng=rng, step_semantics=options["step_semantics"],
+                        random_binding=options["random_binding"], sample_delays=options["sample_delays"])
+        simulator.marking = marking
+        simulator.event_count = state["event_count"]
+        if state["delays"] is not None and seed is None:
+            simulator.context.delay_sampler.set_state(state["delays"])
+        simulator.enabling_cache.set_state(marking, state["enabling"])
+
+        for sink in sinks or []:
+            simulator.add_sink(sink)
+        if sinks and state["sinks"] is not None:
+            if len(state["sinks"]) != len(sinks):
+                raise ValueError(f"The checkpoint holds {len(state['sinks'])} sink states, {len(sinks)} sinks given.")
+            for sink, sink_state in zip(sinks, state["sinks"]):
+                sink.set_state(simulator, sink_state)
+            simulator._started = state["started"]
+        return simulator
+
+    @classmethod
+    def load_checkpoint(cls, path: str, cpn: CPN, context: EvaluationContext,
+                        sinks: Optional[List[SimulationSink]] = None, seed: Any = None) -> "Simulator":
+        with open(path, "rb") as f:
+            return cls.restore(f.read(), cpn, context, sinks=sinks, seed=seed)
+
+    def fork(self, sinks: Optional[List[SimulationSink]] = None, seed: Any = None) -> "Simulator":
+        """
+        Independent copy of the simulation at its current point, with its own (fresh) sinks. Without a seed the
+        fork continues exactly as this simulation would; with a seed it explores another future.
+        """
+        return self.restore(self.checkpoint(include_sinks=False), self.cpn, self.context, sinks=sinks, seed=seed)
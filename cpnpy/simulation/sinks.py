@@ -0,0 +1,311 @@
+import csv
+import datetime
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from cpnpy.cpn.cpn_imp import CPN, EvaluationContext, Marking
+from cpnpy.simulation.simulator import Simulator, SimulationSink, SimulationEvent
+
+
+# -----------------------------------------------------------------------------------
+# Event rows
+# -----------------------------------------------------------------------------------
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+EVENT_COLUMNS = ["ocel:eid", "ocel:activity", "ocel:timestamp"]
+RELATION_COLUMNS = ["ocel:eid", "ocel:activity", "ocel:timestamp", "ocel:oid", "ocel:type", "ocel:qualifier"]
+OBJECT_COLUMNS = ["ocel:oid", "ocel:type"]
+
+
+def event_objects(simulator: Simulator, event: SimulationEvent) -> Set[Tuple[str, str]]:
+    """
+    Objects related to an event: the (stringified) values of the tokens it consumed and produced, typed by the
+    name of the color set of their place. They are read from the occurrence record, without evaluating the arc
+    inscriptions again.
+    """
+    occurrence = event.occurrence
+    related_objects = set()
+    for place, value, _ in occurrence.consumed:
+        related_objects.add((str(value), place.colorset.name))
+    for place, value, _ in occurrence.produced:
+        related_objects.add((str(value), place.colorset.name))
+    return related_objects
+
+
+def event_timestamp(event: SimulationEvent) -> datetime.datetime:
+    """The clock read as seconds since the epoch, plus one microsecond per event so that events stay ordered."""
+    return EPOCH + datetime.timedelta(seconds=event.clock, microseconds=event.index)
+
+
+def event_record(simulator: Simulator, event: SimulationEvent) -> Dict[str, Any]:
+    """
+    Plain dictionary describing an event and its related objects, in the OCEL naming:
+    {"ocel:eid", "ocel:activity", "ocel:timestamp" (ISO 8601), "ocel:omap": [{"ocel:oid", "ocel:type"}, ...]}.
+    """
+    return {
+        "ocel:eid": f"e_{event.index}",
+        "ocel:activity": event.transition.name,
+        "ocel:timestamp": event_timestamp(event).isoformat(),
+        "ocel:omap": [{"ocel:oid": oid, "ocel:type": otype} for oid, otype in sorted(event_objects(simulator, event))],
+    }
+
+
+def iter_simulation_records(cpn: CPN, initial_marking: Marking, context: EvaluationContext,
+                            seed: Optional[int] = None, max_steps: Optional[int] = None,
+                            max_clock: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Simulate the net lazily, yielding one event_record per fired event: nothing is kept in memory.
+    """
+    simulator = Simulator(cpn, initial_marking, context, seed=seed)
+    for event in simulator.iter_events(max_steps=max_steps, max_clock=max_clock):
+        yield event_record(simulator, event)
+
+
+# -----------------------------------------------------------------------------------
+# Chunked file sinks
+# -----------------------------------------------------------------------------------
+def _flushed_position(file) -> int:
+    file.flush()
+    return file.tell()
+
+
+def _reopen_at(path: str, position: int, newline: Optional[str] = None):
+    file = open(path, "r+", newline=newline, encoding="utf-8")
+    file.seek(position)
+    file.truncate()
+    return file
+
+
+class ChunkedSink(SimulationSink, ABC):
+    """
+    Base of the sinks writing the events to disk: rows are buffered and written every chunk_size events, so that
+    the memory used does not grow with the length of the run. The set of distinct objects is the only state
+    kept for the whole run; it is written at the end if an objects path is given.
+    Subclasses implement _open, _write_chunk and _close, and, for checkpoints, _positions (where the files
+    written so far end) and _reopen (continue the files from there).
+    """
+
+    def __init__(self, chunk_size: int = 10000):
+        self.chunk_size = chunk_size
+        self._events: List[List[Any]] = []
+        self._relations: List[List[Any]] = []
+        self._objects: Set[Tuple[str, str]] = set()
+        self.written_events = 0
+
+    def on_start(self, simulator: Simulator):
+        self._events = []
+        self._relations = []
+        self._objects = set()
+        self.written_events = 0
+        self._open()
+
+    def on_event(self, simulator: Simulator, event: SimulationEvent):
+        eid = f"e_{event.index}"
+        activity = event.transition.name
+        timestamp = event_timestamp(event)
+        self._events.append([eid, activity, timestamp])
+        for oid, otype in event_objects(simulator, event):
+            self._objects.add((oid, otype))
+            self._relations.append([eid, activity, timestamp, oid, otype, None])
+        if len(self._events) >= self.chunk_size:
+            self.flush()
+
+    def on_finish(self, simulator: Simulator):
+        self.flush()
+        self._close(sorted(self._objects))
+
+    def flush(self):
+        if self._events:
+            self._write_chunk(self._events, self._relations)
+            self.written_events += len(self._events)
+            self._events = []
+            self._relations = []
+
+    def get_state(self, simulator: Simulator) -> Dict[str, Any]:
+        # Everything buffered is written first: the state is the length of the files written so far
+        self.flush()
+        return {"written_events": self.written_events, "objects": sorted(self._objects), "positions": self._positions()}
+
+    def set_state(self, simulator: Simulator, state: Dict[str, Any]):
+        # Anything written after the checkpoint is cut off, then the files are continued
+        self._events = []
+        self._relations = []
+        self._objects = set(state["objects"])
+        self.written_events = state["written_events"]
+        self._reopen(state["positions"])
+
+    @abstractmethod
+    def _open(self):
+        pass
+
+    @abstractmethod
+    def _positions(self) -> List[int]:
+        pass
+
+    @abstractmethod
+    def _reopen(self, positions: List[int]):
+        pass
+
+    @abstractmethod
+    def _write_chunk(self, events: List[List[Any]], relations: List[List[Any]]):
+        pass
+
+    @abstractmethod
+    def _close(self, objects: List[Tuple[str, str]]):
+        pass
+
+
+class CSVSink(ChunkedSink):
+    """
+    Writes the events, the event-object relations and (optionally) the objects to CSV files, with the
+    columns of the OCEL dataframes.
+    """
+
+    def __init__(self, events_path: str, relations_path: str, objects_path: Optional[str] = None,
+                 chunk_size: int = 10000):
+        super().__init__(chunk_size)
+        self.events_path = events_path
+        self.relations_path = relations_path
+        self.objects_path = objects_path
+
+    def _open(self):
+        self._events_file = open(self.events_path, "w", newline="", encoding="utf-8")
+        self._relations_file = open(self.relations_path, "w", newline="", encoding="utf-8")
+        self._events_writer = csv.writer(self._events_file)
+        self._relations_writer = csv.writer(self._relations_file)
+        self._events_writer.writerow(EVENT_COLUMNS)
+        self._relations_writer.writerow(RELATION_COLUMNS)
+
+    def _positions(self):
+        return [_flushed_position(self._events_file), _flushed_position(self._relations_file)]
+
+    def _reopen(self, positions):
+        self._events_file = _reopen_at(self.events_path, positions[0], newline="")
+        self._relations_file = _reopen_at(self.relations_path, positions[1], newline="")
+        self._events_writer = csv.writer(self._events_file)
+        self._relations_writer = csv.writer(self._relations_file)
+
+    def _write_chunk(self, events, relations):
+        self._events_writer.writerows([eid, activity, ts.isoformat()] for eid, activity, ts in events)
+        self._relations_writer.writerows([eid, activity, ts.isoformat(), oid, otype, qualifier]
+                                         for eid, activity, ts, oid, otype, qualifier in relations)
+
+    def _close(self, objects):
+        self._events_file.close()
+        self._relations_file.close()
+        if self.objects_path is not None:
+            with open(self.objects_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(OBJECT_COLUMNS)
+                writer.writerows(objects)
+
+
+class JSONLinesSink(ChunkedSink):
+    """
+    Writes one JSON object per line and per event (see event_record), and optionally one per object.
+    """
+
+    def __init__(self, path: str, objects_path: Optional[str] = None, chunk_size: int = 10000):
+        super().__init__(chunk_size)
+        self.path = path
+        self.objects_path = objects_path
+
+    def _open(self):
+        self._file = open(self.path, "w", encoding="utf-8")
+
+    def _positions(self):
+        return [_flushed_position(self._file)]
+
+    def _reopen(self, positions):
+        self._file = _reopen_at(self.path, positions[0])
+
+    def _write_chunk(self, events, relations):
+        omaps: Dict[str, List[Dict[str, str]]] = {}
+        for eid, _, _, oid, otype, _ in relations:
+            omaps.setdefault(eid, []).append({"ocel:oid": oid, "ocel:type": otype})
+        self._file.write("".join(
+            json.dumps({"ocel:eid": eid, "ocel:activity": activity, "ocel:timestamp": timestamp.isoformat(),
+                        "ocel:omap": omaps.get(eid, [])}) + "\n"
+            for eid, activity, timestamp in events))
+
+    def _close(self, objects):
+        self._file.close()
+        if self.objects_path is not None:
+            with open(self.objects_path, "w", encoding="utf-8") as f:
+                for oid, otype in objects:
+                    f.write(json.dumps({"ocel:oid": oid, "ocel:type": otype}) + "\n")
+
+
+class ParquetSink(ChunkedSink):
+    """
+    Writes the events and the relations as Parquet datasets: events_path and relations_path are directories
+    holding one part file per chunk (part-00000000.parquet, ...), readable as a whole by e.g. pandas.read_parquet.
+    The objects, if an objects path is given, are written to a single Parquet file at the end.
+    A checkpoint records the number of parts written, so that a resumed run drops the later parts and continues.
+    Requires pyarrow.
+    """
+
+    def __init__(self, events_path: str, relations_path: str, objects_path: Optional[str] = None,
+                 chunk_size: int = 100000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("ParquetSink requires pyarrow (pip install pyarrow).") from e
+        super().__init__(chunk_size)
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.events_path = events_path
+        self.relations_path = relations_path
+        self.objects_path = objects_path
+        self._parts = 0
+
+    def _table(self, rows: List[List[Any]], columns: List[str]):
+        pa = self._pa
+        data = {}
+        for i, name in enumerate(columns):
+            column = [row[i] for row in rows]
+            if name == "ocel:timestamp":
+                data[name] = pa.array(column, type=pa.timestamp("us", tz="UTC"))
+            else:
+                data[name] = pa.array(column, type=pa.string())
+        return pa.table(data)
+
+    @staticmethod
+    def _part_path(directory: str, part: int) -> str:
+        return os.path.join(directory, f"part-{part:08d}.parquet")
+
+    def _remove_parts(self, first: int):
+        # Parts from index first on (left by a previous run, or written after the checkpoint being resumed)
+        for directory in (self.events_path, self.relations_path):
+            for name in os.listdir(directory):
+                if name.startswith("part-") and name.endswith(".parquet") and int(name[5:-8]) >= first:
+                    os.remove(os.path.join(directory, name))
+
+    def _open(self):
+        os.makedirs(self.events_path, exist_ok=True)
+        os.makedirs(self.relations_path, exist_ok=True)
+        self._remove_parts(0)
+        self._parts = 0
+
+    def _positions(self):
+        return [self._parts]
+
+    def _reopen(self, positions):
+        self._parts = positions[0]
+        self._remove_parts(self._parts)
+
+    def _write_chunk(self, events, relations):
+        self._pq.write_table(self._table(events, EVENT_COLUMNS), self._part_path(self.events_path, self._parts))
+        self._pq.write_table(self._table(relations, RELATION_COLUMNS),
+                             self._part_path(self.relations_path, self._parts))
+        self._parts += 1
+
+    def _close(self, objects):
+        if not self._parts:
+            # No event at all: write empty parts with the right schema
+            self._write_chunk([], [])
+        if self.objects_path is not None:
+            self._pq.write_table(self._table([list(o) for o in objects], OBJECT_COLUMNS), self.objects_path)
@@ -0,0 +1,26 @@
+from typing import Any
+
+
+def _freeze(value: Any) -> Any:
+    # Containers are tagged with their type so that, e.g., [1, 2] and (1, 2) stay distinct
+    if isinstance(value, list):
+        return list, tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return dict, frozenset((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, set):
+        return set, frozenset(_freeze(v) for v in value)
+    if isinstance(value, tuple):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def token_value_key(value: Any) -> Any:
+    """
+    Return a hashable key identifying a token value. Hashable values are their own key;
+    unhashable ones (lists, dicts, ...) are converted to an equivalent frozen structure.
+    """
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return _freeze(value)
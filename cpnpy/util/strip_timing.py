@@ -1,4 +1,5 @@
 import copy
+from cpnpy.cpn.cpn_imp import Multiset
 
 
 def strip_timed_information(cpn, marking):
@@ -23,9 +24,11 @@ def strip_timed_information(cpn, marking):
             a.expression = a.expression.split('@+')[0].strip()
 
     # 4. Remove all timestamps from tokens in the marking
-    for ms in marking_copy._marking.values():
-        for tok in ms.tokens:
-            tok.timestamp = 0
+    for place_name, ms in marking_copy._marking.items():
+        stripped = Multiset()
+        for value, timestamps in ms.items():
+            stripped.add(value, 0, count=len(timestamps))
+        marking_copy._marking[place_name] = stripped
 
     # Reset the global clock
     marking_copy.global_clock = 0
@@ -0,0 +1,59 @@
+import gc
+import tracemalloc
+
+from cpnpy.cpn.cpn_imp import *
+
+
+# Memory footprint of a marking holding 1M tokens, measured with tracemalloc.
+N_TOKENS = 1_000_000
+
+
+class DictToken:
+    # Token as it was before __slots__, for comparison
+    def __init__(self, value, timestamp=0):
+        self.value = value
+        self.timestamp = timestamp
+
+
+def measure(label, build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<55} {current / 2 ** 20:8.1f} MiB  {current / N_TOKENS:6.1f} bytes/token")
+    return obj
+
+
+values = [f"CASE_{i}" for i in range(N_TOKENS)]
+
+# Token objects alone (the values are shared by all the measurements and not counted)
+measure("list of dict-backed tokens", lambda: [DictToken(v, i) for i, v in enumerate(values)])
+measure("list of slotted Token", lambda: [Token(v, i) for i, v in enumerate(values)])
+
+
+# Markings: 1M distinct case tokens in one place, and 1M identical resource tokens in another
+def distinct_marking():
+    marking = Marking()
+    marking.set_tokens("Cases", values)
+    return marking
+
+
+def identical_marking():
+    marking = Marking()
+    marking.add_tokens("Resources", [()] * N_TOKENS)
+    return marking
+
+
+def timed_identical_marking():
+    marking = Marking()
+    ms = Multiset()
+    for i in range(N_TOKENS):
+        ms.add("r", timestamp=i % 1000)
+    marking._marking["Resources"] = ms
+    return marking
+
+
+measure("marking, 1M distinct untimed values", distinct_marking)
+measure("marking, 1M identical untimed values", identical_marking)
+measure("marking, 1M identical values over 1000 timestamps", timed_identical_marking)
@@ -0,0 +1,75 @@
+from cpnpy.cpn.cpn_imp import *
+
+
+def _net(pattern):
+    colorsets = ColorSetParser().parse_definitions("colset INT = int;\ncolset PAIR = product(INT, INT);")
+    a, b = Place("a", colorsets["INT"]), Place("b", colorsets["INT"])
+    c = Place("c", colorsets["PAIR"])
+    t = Transition("T", variables=["x", "y"])
+    cpn = CPN()
+    for place in (a, b, c):
+        cpn.add_place(place)
+    cpn.add_transition(t)
+    cpn.add_arc(Arc(a, t, "x"))
+    cpn.add_arc(Arc(b, t, "y"))
+    cpn.add_arc(Arc(c, t, pattern))
+    return cpn, t
+
+
+def _bindings(pattern, c_tokens):
+    cpn, t = _net(pattern)
+    marking = Marking()
+    marking.set_tokens("a", [1, 2])
+    marking.set_tokens("b", [3, 4])
+    marking.set_tokens("c", c_tokens)
+    return sorted((b["x"], b["y"]) for b in cpn.iter_bindings(t, marking, EvaluationContext()))
+
+
+def test_variable_read_directly_and_bound_by_tuple_pattern():
+    # y is bound by the pattern and must only be checked against place b
+    assert _bindings("(x, y)", [(1, 3), (2, 5), (7, 4)]) == [(1, 3)]
+
+
+def test_variable_read_directly_and_bound_by_reversed_tuple_pattern():
+    assert _bindings("(y, x)", [(3, 1), (4, 2), (5, 1)]) == [(1, 3), (2, 4)]
+
+
+def test_variables_read_directly_and_bound_by_token_list():
+    # [x, y] takes two tokens from c, each of which must also be in a (for x) and b (for y)
+    assert _bindings("[x, y]", [1, 3, 2]) == [(1, 3), (2, 3)]
+
+
+def test_firing_while_iterating_bindings():
+    colorsets = ColorSetParser().parse_definitions("colset INT = int;")
+    p, q = Place("p", colorsets["INT"]), Place("q", colorsets["INT"])
+    t = Transition("T", variables=["x"])
+    cpn = CPN()
+    cpn.add_place(p)
+    cpn.add_place(q)
+    cpn.add_transition(t)
+    cpn.add_arc(Arc(p, t, "x"))
+    cpn.add_arc(Arc(t, q, "x"))
+    marking = Marking()
+    marking.set_tokens("p", [1, 2, 3])
+    context = EvaluationContext()
+    fired = []
+    for binding in cpn.iter_bindings(t, marking, context):
+        cpn.fire_transition(t, marking, context, binding)
+        fired.append(binding["x"])
+    assert sorted(fired) == [1, 2, 3]
+    assert len(marking.get_multiset("p")) == 0
+
+
+def test_binding_multiplicity_counts_token_combinations():
+    colorsets = ColorSetParser().parse_definitions("colset INT = int;")
+    p = Place("p", colorsets["INT"])
+    t = Transition("T", variables=["x"])
+    cpn = CPN()
+    cpn.add_place(p)
+    cpn.add_transition(t)
+    cpn.add_arc(Arc(p, t, "[x, x]"))
+    marking = Marking()
+    marking.set_tokens("p", [1, 1, 1, 2, 3, 3])
+    result = cpn._find_all_bindings(t, marking, EvaluationContext(), with_multiplicity=True)
+    # Two tokens among three 1s, or the two 3s
+    assert sorted((b["x"], n) for b, n in result) == [(1, 3), (3, 1)]
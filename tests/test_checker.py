@@ -0,0 +1,98 @@
+import json
+import os
+
+from cpnpy.analysis.checker import OnTheFlyChecker
+from cpnpy.analysis.reachability import copy_marking, equiv_marking_to_key, iter_successors
+from cpnpy.cpn.cpn_imp import *
+from cpnpy.cpn.importer import import_cpn_from_json
+
+FILES = os.path.join(os.path.dirname(__file__), "..", "files")
+
+
+def _load(folder, name):
+    with open(os.path.join(FILES, folder, name + ".json")) as f:
+        return import_cpn_from_json(json.load(f))
+
+
+def _counter_net():
+    # T moves the tokens of P1 to P2 one by one, U puts back the ones below 3, increased by one
+    colorsets = ColorSetParser().parse_definitions("colset INT = int;")
+    p1, p2 = Place("P1", colorsets["INT"]), Place("P2", colorsets["INT"])
+    t = Transition("T", variables=["x"])
+    u = Transition("U", variables=["y"], guard="y < 3")
+    cpn = CPN()
+    cpn.add_place(p1)
+    cpn.add_place(p2)
+    cpn.add_transition(t)
+    cpn.add_transition(u)
+    cpn.add_arc(Arc(p1, t, "x"))
+    cpn.add_arc(Arc(t, p2, "x"))
+    cpn.add_arc(Arc(p2, u, "y"))
+    cpn.add_arc(Arc(u, p1, "y + 1"))
+    marking = Marking()
+    marking.set_tokens("P1", [0, 1])
+    return cpn, marking, EvaluationContext()
+
+
+def _assert_replays(cpn, initial_marking, context, result):
+    # Every step of the witness leads, from the initial marking, to the next marking of the path
+    assert len(result.markings) == len(result.witness) + 1
+    assert equiv_marking_to_key(result.markings[0]) == equiv_marking_to_key(initial_marking)
+    current = copy_marking(initial_marking)
+    for (transition, binding), expected in zip(result.witness, result.markings[1:]):
+        successors = [m for t, b, m in iter_successors(cpn, current, context) if (t, b) == (transition, binding)]
+        assert equiv_marking_to_key(expected) in {equiv_marking_to_key(m) for m in successors}
+        current = copy_marking(expected)
+    assert result.counterexample is result.markings[-1]
+
+
+def test_dead_marking_witness_replays():
+    cpn, marking, context = _counter_net()
+    result = OnTheFlyChecker(cpn, marking, context).find_dead_marking()
+    assert result.found and result.verdict == "violated"
+    _assert_replays(cpn, marking, context, result)
+    # The counterexample has no successor: all the tokens are 3 in P2
+    assert list(iter_successors(cpn, copy_marking(result.counterexample), context)) == []
+    assert sorted(t.value for t in result.counterexample.get_multiset("P2").tokens) == [3, 3]
+
+
+def test_predicate_witness_is_shortest_and_replays():
+    cpn, marking, context = _counter_net()
+    result = OnTheFlyChecker(cpn, marking, context).find_marking(
+        lambda m: 2 in [t.value for t in m.get_multiset("P1").tokens], name="2 in P1")
+    assert result.found
+    # 1 -> P2 -> 2 in P1: two steps
+    assert len(result.witness) == 2
+    _assert_replays(cpn, marking, context, result)
+
+
+def test_bound_violation_witness_on_timed_net_replays():
+    cpn, marking, context = _load("bigger_cpns", "electronic_manufacturing")
+    checker = OnTheFlyChecker(cpn, marking, context)
+    place = "P_ApprovedProducts"
+    result = checker.find_bound_violation(place, 0)
+    assert result.verdict == "violated"
+    assert len(result.counterexample.get_multiset(place)) > 0
+    _assert_replays(cpn, marking, context, result)
+
+
+def test_property_that_holds_on_a_bounded_run():
+    cpn, marking, context = _counter_net()
+    # Limits that the whole state space fits in: the verdict is conclusive
+    checker = OnTheFlyChecker(cpn, marking, context, max_states=1000, max_depth=100, time_budget=60)
+    result = checker.find_bound_violation("P1", 2)
+    assert not result.found and result.complete
+    assert result.verdict == "holds" and result.termination == "complete"
+    result = checker.find_marking(lambda m: len(m.get_multiset("P2")) > 2)
+    assert result.verdict == "holds"
+
+
+def test_limits_make_a_missing_counterexample_inconclusive():
+    # ex5 has an infinite state space
+    cpn, marking, context = _load("minimal_cpns", "ex5")
+    result = OnTheFlyChecker(cpn, marking, context, max_states=50).find_marking(lambda m: False)
+    assert result.verdict == "inconclusive" and result.termination == "max_states"
+    assert result.states_explored == 50
+    cpn, marking, context = _counter_net()
+    result = OnTheFlyChecker(cpn, marking, context, max_depth=1).find_bound_violation("P1", 2)
+    assert result.verdict == "inconclusive" and result.termination == "max_depth"
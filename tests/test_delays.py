@@ -0,0 +1,36 @@
+from cpnpy.cpn.cpn_imp import *
+from cpnpy.cpn.delays import DelaySampler
+
+SCIPY_CODE = "from scipy.stats import norm, expon"
+USER_CODE = """
+class Constant:
+    def __init__(self, value):
+        self.value = value
+
+    def rvs(self, **params):
+        return self.value
+
+norm = Constant(42.0)
+"""
+
+
+def _arc_delays(context, expression, n=5):
+    return [context.evaluate_arc(expression, {"x": 1})[1] for _ in range(n)]
+
+
+def test_scipy_distributions_are_served_by_the_sampler():
+    context = EvaluationContext(user_code=SCIPY_CODE, delay_sampler=DelaySampler(seed=3))
+    delays = _arc_delays(context, "x @+norm.rvs(loc=5.0, scale=1.0)")
+    reference = DelaySampler(seed=3)
+    assert delays == [reference.sample(("norm", (("loc", 5.0), ("scale", 1.0)))) for _ in range(5)]
+
+
+def test_user_defined_names_are_evaluated_as_written():
+    context = EvaluationContext(user_code=USER_CODE, delay_sampler=DelaySampler(seed=3))
+    assert _arc_delays(context, "x @+norm.rvs(loc=5.0, scale=1.0)") == [42] * 5
+    # A variable of the binding shadows the distribution as well
+    context = EvaluationContext(user_code=SCIPY_CODE, delay_sampler=DelaySampler(seed=3))
+    user_env = {}
+    exec(USER_CODE, user_env)
+    binding = {"x": 1, "expon": user_env["Constant"](7.0)}
+    assert context.evaluate_arc("x @+expon.rvs(scale=2.0)", binding)[1] == 7
@@ -0,0 +1,97 @@
+import copy
+import random
+
+import pytest
+
+from cpnpy.cpn.cpn_imp import *
+
+
+def _net():
+    colorsets = ColorSetParser().parse_definitions("colset INT = int timed;")
+    p, q = Place("p", colorsets["INT"]), Place("q", colorsets["INT"])
+    a = Transition("A", variables=["x"])
+    b = Transition("B", variables=["x"])
+    c = Transition("C", variables=["x"])
+    cpn = CPN()
+    for place in (p, q):
+        cpn.add_place(place)
+    for t in (a, b, c):
+        cpn.add_transition(t)
+    # A moves a token to q, ready at once; B puts it back to p, changed; C delays a token of p
+    cpn.add_arc(Arc(p, a, "x"))
+    cpn.add_arc(Arc(a, q, "x"))
+    cpn.add_arc(Arc(q, b, "x"))
+    cpn.add_arc(Arc(b, p, "(x + 1) % 3"))
+    cpn.add_arc(Arc(p, c, "x"))
+    cpn.add_arc(Arc(c, p, "x @+3"))
+    marking = Marking()
+    marking.set_tokens("p", [0, 1, 2, 0, 1], [0, 1, 2, 5, 2])
+    marking.set_tokens("q", [1], [0])
+    marking.global_clock = 2
+    return cpn, marking
+
+
+def _tokens(marking):
+    return {place: sorted((t.value, t.timestamp) for t in ms.tokens) for place, ms in marking._marking.items()}
+
+
+def _sequence(cpn, marking, context, rng, length):
+    # A run fired one element at a time, on a copy of the marking
+    marking = copy.deepcopy(marking)
+    steps = []
+    for _ in range(length):
+        enabled = [(t, b) for t in cpn.transitions for b in cpn.iter_bindings(t, marking, context)]
+        if not enabled:
+            break
+        t, binding = rng.choice(enabled)
+        cpn.fire_transition(t, marking, context, binding)
+        steps.append((t, binding))
+    return steps, marking
+
+
+def test_fire_batch_matches_sequential_firing():
+    context = EvaluationContext()
+    rng = random.Random(0)
+    for _ in range(50):
+        cpn, marking = _net()
+        steps, expected = _sequence(cpn, marking, context, rng, rng.randint(1, 20))
+        cpn.fire_batch(steps, marking, context)
+        assert _tokens(marking) == _tokens(expected)
+
+
+def test_fire_batch_consumes_tokens_produced_by_the_batch():
+    context = EvaluationContext()
+    cpn, marking = _net()
+    a, b = cpn.get_transition_by_name("A"), cpn.get_transition_by_name("B")
+    # The token 2 goes to q and comes back as 0, then is moved to q again
+    steps = [(a, {"x": 2}), (b, {"x": 2}), (a, {"x": 0}), (a, {"x": 0})]
+    expected = copy.deepcopy(marking)
+    for t, binding in steps:
+        cpn.fire_transition(t, expected, context, binding)
+    cpn.fire_batch(steps, marking, context)
+    assert _tokens(marking) == _tokens(expected)
+
+
+def test_fire_batch_rejects_consumption_before_production():
+    context = EvaluationContext()
+    cpn, marking = _net()
+    a, b = cpn.get_transition_by_name("A"), cpn.get_transition_by_name("B")
+    before = _tokens(marking)
+    # B needs the token 2 in q before A has put it there
+    with pytest.raises(RuntimeError):
+        cpn.fire_batch([(b, {"x": 2}), (a, {"x": 2})], marking, context)
+    assert _tokens(marking) == before
+    cpn.fire_batch([(a, {"x": 2}), (b, {"x": 2})], marking, context)
+    assert (0, 2) in _tokens(marking)["p"]
+
+
+def test_fire_batch_does_not_take_future_tokens():
+    context = EvaluationContext()
+    cpn, marking = _net()
+    a = cpn.get_transition_by_name("A")
+    # p holds 0 ready at 0 and 0 at 5, after the clock: only the first can be consumed
+    cpn.fire_batch([(a, {"x": 0})], marking, context)
+    assert (0, 5) in _tokens(marking)["p"]
+    assert (0, 0) not in _tokens(marking)["p"]
+    with pytest.raises(RuntimeError):
+        cpn.fire_batch([(a, {"x": 0})], marking, context)
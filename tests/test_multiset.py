@@ -0,0 +1,127 @@
+import copy
+import random
+
+import pytest
+
+from cpnpy.cpn.cpn_imp import *
+
+
+class _ListModel:
+    """Reference multiset: a plain list of (value, timestamp) tokens."""
+
+    def __init__(self):
+        self.tokens = []
+
+    def add(self, value, ts, count=1):
+        self.tokens.extend([(value, ts)] * count)
+
+    def remove(self, value, count=1):
+        # Youngest (largest timestamp) first
+        timestamps = sorted(ts for v, ts in self.tokens if v == value)
+        removed = timestamps[len(timestamps) - count:]
+        for ts in removed:
+            self.tokens.remove((value, ts))
+        return removed
+
+    def count_value(self, value):
+        return sum(1 for v, _ in self.tokens if v == value)
+
+    def count_ready(self, value, clock):
+        return sum(1 for v, ts in self.tokens if v == value and ts <= clock)
+
+    def next_timestamp(self, after):
+        return min((ts for _, ts in self.tokens if ts > after), default=None)
+
+
+def _assert_same(ms, model, values, clocks):
+    assert len(ms) == len(model.tokens)
+    assert sorted(((t.value, t.timestamp) for t in ms.tokens), key=repr) == sorted(model.tokens, key=repr)
+    for value in values:
+        assert ms.count_value(value) == model.count_value(value)
+        for clock in clocks:
+            assert ms.count_ready(value, clock) == model.count_ready(value, clock)
+
+
+def test_multiset_matches_list_model():
+    rng = random.Random(0)
+    values = ["a", "b", (1, 2), 3]
+    clocks = range(-1, 12)
+    ms, model = Multiset(), _ListModel()
+    for _ in range(2000):
+        op = rng.random()
+        value = rng.choice(values)
+        if op < 0.45:
+            ts, count = rng.randint(0, 10), rng.randint(1, 3)
+            ms.add(value, ts, count)
+            model.add(value, ts, count)
+        elif op < 0.8:
+            available = model.count_value(value)
+            if available:
+                count = rng.randint(1, available)
+                assert ms.remove(value, count) == model.remove(value, count)
+        else:
+            # Queries going forwards and backwards, as when the clock of a copy is reset
+            after = rng.choice(clocks)
+            assert ms.next_timestamp(after) == model.next_timestamp(after)
+        _assert_same(ms, model, values, clocks)
+
+
+def test_remove_token_at_heap_minimum():
+    ms, model = Multiset(), _ListModel()
+    for value, ts in [("a", 5), ("b", 3), ("a", 8), ("b", 9)]:
+        ms.add(value, ts)
+        model.add(value, ts)
+    assert ms.next_timestamp(0) == 3
+    # The only token at timestamp 3 leaves: its heap entry is stale
+    assert ms.remove("b") == model.remove("b") == [9]
+    assert ms.remove("b") == model.remove("b") == [3]
+    assert ms.next_timestamp(0) == model.next_timestamp(0) == 5
+    assert ms.remove("a", 2) == model.remove("a", 2) == [5, 8]
+    assert ms.next_timestamp(0) is None
+    # A timestamp added again after its entry was discarded is found again
+    ms.add("c", 3)
+    model.add("c", 3)
+    assert ms.next_timestamp(0) == model.next_timestamp(0) == 3
+    _assert_same(ms, model, ["a", "b", "c"], range(10))
+
+
+def test_remove_more_than_available_raises():
+    ms = Multiset([Token("a", 1)])
+    with pytest.raises(ValueError):
+        ms.remove("a", 2)
+    assert len(ms) == 1
+
+
+def test_copies_are_independent():
+    rng = random.Random(1)
+    ms, model = Multiset(), _ListModel()
+    for _ in range(50):
+        value, ts = rng.choice("abc"), rng.randint(0, 10)
+        ms.add(value, ts)
+        model.add(value, ts)
+    ms.next_timestamp(4)
+    for duplicate in (copy.copy(ms), copy.deepcopy(ms)):
+        clone = copy.deepcopy(model)
+        for value in "abc":
+            n = clone.count_value(value)
+            if n:
+                assert duplicate.remove(value, (n + 1) // 2) == clone.remove(value, (n + 1) // 2)
+        duplicate.add("d", 2)
+        clone.add("d", 2)
+        for after in (0, 6, 1):
+            assert duplicate.next_timestamp(after) == clone.next_timestamp(after)
+        _assert_same(duplicate, clone, "abcd", range(12))
+        # The original is unchanged
+        _assert_same(ms, model, "abcd", range(12))
+        for after in (0, 6, 1):
+            assert ms.next_timestamp(after) == model.next_timestamp(after)
+
+
+def test_remove_ready_takes_the_youngest_ready_tokens():
+    ms = Multiset([Token("a", ts) for ts in (0, 3, 5, 8)])
+    assert ms.remove_ready("a", 5) == [5]
+    assert ms.remove_ready("a", 5, 2) == [0, 3]
+    with pytest.raises(ValueError):
+        ms.remove_ready("a", 5)
+    assert [t.timestamp for t in ms.tokens] == [8]
+    assert ms.next_timestamp(5) == 8
@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+from cpnpy.analysis.parallel import build_reachability_graph_parallel
+from cpnpy.analysis.reachability import build_reachability_graph, copy_marking, equiv_marking_to_key, iter_successors
+from cpnpy.cpn.cpn_imp import *
+from cpnpy.cpn.importer import import_cpn_from_json
+
+FILES = os.path.join(os.path.dirname(__file__), "..", "files")
+
+
+def _load(name):
+    folder = "minimal_cpns" if name.startswith("ex") else "bigger_cpns"
+    with open(os.path.join(FILES, folder, name + ".json")) as f:
+        return import_cpn_from_json(json.load(f))
+
+
+def _timed_net(tokens):
+    colorsets = ColorSetParser().parse_definitions("colset INT = int timed;")
+    p1, p2 = Place("P1", colorsets["INT"]), Place("P2", colorsets["INT"])
+    t = Transition("T", variables=["x"])
+    u = Transition("U", variables=["y"], guard="y < 5")
+    cpn = CPN()
+    cpn.add_place(p1)
+    cpn.add_place(p2)
+    cpn.add_transition(t)
+    cpn.add_transition(u)
+    cpn.add_arc(Arc(p1, t, "x"))
+    cpn.add_arc(Arc(t, p2, "x @+2"))
+    cpn.add_arc(Arc(p2, u, "y"))
+    cpn.add_arc(Arc(u, p1, "y + 1"))
+    marking = Marking()
+    marking.set_tokens("P1", tokens)
+    return cpn, marking, EvaluationContext()
+
+
+def _edges(RG):
+    # Binding elements leading to the same successor share one DiGraph edge, labelled by the last one added
+    return set(RG.edges)
+
+
+@pytest.mark.parametrize("net", ["ex3", "electronic_manufacturing", "timed"])
+def test_parallel_graph_equals_serial_graph(net):
+    cpn, marking, context = _load(net) if net != "timed" else _timed_net([0, 1, 1, 2, 3])
+    serial = build_reachability_graph(cpn, marking, context)
+    parallel = build_reachability_graph_parallel(cpn, marking, context, n_workers=3, batch_size=7)
+    assert set(parallel.nodes) == set(serial.nodes)
+    assert _edges(parallel) == _edges(serial)
+    assert parallel.graph["termination"] == "complete" and parallel.graph["complete"]
+    assert parallel.graph["frontier"] == []
+
+
+def test_parallel_store_equals_serial_graph():
+    cpn, marking, context = _timed_net([0, 1, 1, 2])
+    serial = build_reachability_graph(cpn, marking, context, semantics="step")
+    store = build_reachability_graph_parallel(cpn, marking, context, n_workers=2, semantics="step", output="store")
+    assert equiv_marking_to_key(store.decode(0)) == equiv_marking_to_key(marking)
+    assert {equiv_marking_to_key(store.decode(i)) for i in range(len(store))} == set(serial.nodes)
+    assert store.number_of_edges() == serial.number_of_edges()
+    assert store.complete and store.termination == "complete"
+
+
+def test_parallel_max_states():
+    # ex5 never terminates without a limit
+    cpn, marking, context = _load("ex5")
+    for output in ("graph", "store"):
+        result = build_reachability_graph_parallel(cpn, marking, context, n_workers=3, batch_size=5,
+                                                   max_states=50, output=output)
+        if output == "graph":
+            assert result.number_of_nodes() == 50
+            assert result.graph["termination"] == "max_states" and not result.graph["complete"]
+            assert result.graph["frontier"] and all(node in result for node in result.graph["frontier"])
+        else:
+            assert len(result) == 50
+            assert result.termination == "max_states" and not result.complete
+            assert result.frontier and all(0 <= node < 50 for node in result.frontier)
+
+
+def test_parallel_max_depth_equals_serial():
+    cpn, marking, context = _load("ex5")
+    serial = build_reachability_graph(cpn, marking, context, max_depth=6)
+    parallel = build_reachability_graph_parallel(cpn, marking, context, n_workers=2, max_depth=6)
+    assert set(parallel.nodes) == set(serial.nodes)
+    assert _edges(parallel) == _edges(serial)
+    assert parallel.graph["termination"] == "max_depth"
+    assert set(parallel.graph["frontier"]) == set(serial.graph["frontier"])
+
+
+def test_parallel_time_budget():
+    cpn, marking, context = _load("ex5")
+    RG = build_reachability_graph_parallel(cpn, marking, context, n_workers=2, batch_size=10, time_budget=0.5)
+    assert RG.graph["termination"] == "time_budget" and not RG.graph["complete"]
+    assert RG.graph["frontier"]
+    # Every state outside the frontier has all its successors in the graph
+    frontier = set(RG.graph["frontier"])
+    for node, marking in RG.nodes(data="marking"):
+        if node not in frontier:
+            successors = iter_successors(cpn, copy_marking(marking), context)
+            assert set(RG.successors(node)) == {equiv_marking_to_key(m) for _, _, m in successors}
+
+
+def test_parallel_max_memory():
+    cpn, marking, context = _load("ex5")
+    RG = build_reachability_graph_parallel(cpn, marking, context, n_workers=2, max_memory=1)
+    assert RG.graph["termination"] == "max_memory"
+    assert RG.graph["frontier"]
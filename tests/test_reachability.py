@@ -0,0 +1,111 @@
+import json
+import os
+
+import networkx as nx
+import pytest
+
+from cpnpy.analysis.analyzer import StateSpaceAnalyzer
+from cpnpy.analysis.reachability import (build_reachability_graph, build_state_store, copy_marking,
+                                         equiv_marking_to_key, iter_successors)
+from cpnpy.cpn.cpn_imp import *
+from cpnpy.cpn.importer import import_cpn_from_json
+
+FILES = os.path.join(os.path.dirname(__file__), "..", "files", "minimal_cpns")
+
+
+def _load(name):
+    with open(os.path.join(FILES, name + ".json")) as f:
+        return import_cpn_from_json(json.load(f))
+
+
+def _fully_expanded(cpn, context, RG, node):
+    successors = iter_successors(cpn, copy_marking(RG.nodes[node]["marking"]), context)
+    return set(RG.successors(node)) == {equiv_marking_to_key(m) for _, _, m in successors}
+
+
+def test_complete_exploration():
+    cpn, marking, context = _load("ex3")
+    RG = build_reachability_graph(cpn, marking, context, max_states=100, max_depth=100, time_budget=60)
+    assert RG.graph["termination"] == "complete" and RG.graph["complete"]
+    assert RG.graph["frontier"] == []
+    assert RG.number_of_nodes() == 2
+
+
+@pytest.mark.parametrize("order", ["bfs", "dfs", "random"])
+def test_max_states(order):
+    # ex5 has an infinite state space
+    cpn, marking, context = _load("ex5")
+    RG = build_reachability_graph(cpn, marking, context, max_states=40, order=order, seed=0)
+    assert RG.number_of_nodes() == 40
+    assert RG.graph["termination"] == "max_states" and not RG.graph["complete"]
+    frontier = set(RG.graph["frontier"])
+    assert frontier and frontier <= set(RG.nodes)
+    for node in RG.nodes:
+        if node not in frontier:
+            assert _fully_expanded(cpn, context, RG, node)
+
+
+def test_max_depth():
+    cpn, marking, context = _load("ex5")
+    RG = build_reachability_graph(cpn, marking, context, max_depth=5)
+    assert RG.graph["termination"] == "max_depth" and not RG.graph["complete"]
+    init = equiv_marking_to_key(marking)
+    depths = nx.single_source_shortest_path_length(RG, init)
+    assert max(depths.values()) == 5
+    # The frontier is exactly the states found at the depth limit, none of which was expanded
+    assert set(RG.graph["frontier"]) == {node for node, depth in depths.items() if depth == 5}
+    for node in RG.graph["frontier"]:
+        assert RG.out_degree(node) == 0
+    for node, depth in depths.items():
+        if depth < 5:
+            assert _fully_expanded(cpn, context, RG, node)
+
+
+def test_time_budget():
+    cpn, marking, context = _load("ex5")
+    RG = build_reachability_graph(cpn, marking, context, time_budget=0)
+    assert RG.graph["termination"] == "time_budget" and not RG.graph["complete"]
+    assert RG.graph["frontier"] == [equiv_marking_to_key(marking)]
+    RG = build_reachability_graph(cpn, marking, context, time_budget=0.2)
+    assert RG.graph["termination"] == "time_budget" and RG.number_of_nodes() > 1
+
+
+def test_max_memory():
+    cpn, marking, context = _load("ex5")
+    RG = build_reachability_graph(cpn, marking, context, max_memory=1)
+    assert RG.graph["termination"] == "max_memory" and not RG.graph["complete"]
+
+
+def test_state_store_attributes():
+    cpn, marking, context = _load("ex5")
+    store = build_state_store(cpn, marking, context, max_states=30)
+    assert len(store) == 30
+    assert store.termination == "max_states" and not store.complete
+    RG = store.to_networkx()
+    assert RG.graph["termination"] == "max_states" and not RG.graph["complete"]
+    assert RG.graph["frontier"] == store.frontier and all(0 <= node < 30 for node in store.frontier)
+
+    cpn, marking, context = _load("ex3")
+    store = build_state_store(cpn, marking, context)
+    assert store.complete and store.termination == "complete" and store.frontier == []
+
+
+def test_analyzer_on_partial_graph_is_inconclusive():
+    cpn, marking, context = _load("ex5")
+    analyzer = StateSpaceAnalyzer(cpn, marking, context, max_states=25)
+    summary = analyzer.summarize()
+    assert summary["status"] == "inconclusive" and not analyzer.complete
+    for key in ("dead_transitions", "live_transitions", "impartial_transitions", "home_markings"):
+        assert summary[key] == "inconclusive"
+    assert summary["unexplored_markings"]
+    # Unexplored markings are never reported as dead
+    assert not set(summary["dead_markings"]) & set(summary["unexplored_markings"])
+
+
+def test_analyzer_on_complete_graph():
+    cpn, marking, context = _load("ex3")
+    summary = StateSpaceAnalyzer(cpn, marking, context).summarize()
+    assert summary["status"] == "complete"
+    assert summary["unexplored_markings"] == []
+    assert isinstance(summary["dead_transitions"], list)
+    assert len(summary["dead_markings"]) == 1
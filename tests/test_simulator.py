@@ -0,0 +1,168 @@
+import csv
+import json
+import os
+
+import pytest
+
+from cpnpy.cpn.cpn_imp import *
+from cpnpy.simulation.simulator import SimulationSink, Simulator
+from cpnpy.simulation.sinks import CSVSink, JSONLinesSink, ParquetSink
+
+N_EVENTS = 200
+CHECKPOINT_AT = 80
+
+
+def _net():
+    # Random choices (transition, binding) and delays drawn from scipy distributions, served by a DelaySampler
+    colorsets = ColorSetParser().parse_definitions("colset INT = int timed;")
+    p1, p2 = Place("P1", colorsets["INT"]), Place("P2", colorsets["INT"])
+    t = Transition("T", variables=["x"])
+    u = Transition("U", variables=["y"])
+    cpn = CPN()
+    cpn.add_place(p1)
+    cpn.add_place(p2)
+    cpn.add_transition(t)
+    cpn.add_transition(u)
+    cpn.add_arc(Arc(p1, t, "x"))
+    cpn.add_arc(Arc(t, p2, "x @+expon.rvs(scale=3.0)"))
+    cpn.add_arc(Arc(p2, u, "y"))
+    cpn.add_arc(Arc(u, p1, "(y + 1) % 7 @+uniform.rvs(loc=1.0, scale=4.0)"))
+    marking = Marking()
+    marking.set_tokens("P1", [0, 1, 2, 3, 4, 5])
+    return cpn, marking, EvaluationContext(user_code="from scipy.stats import expon, uniform")
+
+
+class _RecordingSink(SimulationSink):
+    def __init__(self):
+        self.events = []
+
+    def on_event(self, simulator, event):
+        self.events.append((event.index, event.clock, event.transition.name, sorted(event.binding.items())))
+
+
+def _tokens(marking):
+    return {place: sorted((t.value, t.timestamp) for t in ms.tokens) for place, ms in marking._marking.items()}
+
+
+def _simulator(sinks, seed=11):
+    cpn, marking, context = _net()
+    return Simulator(cpn, marking, context, seed=seed, sinks=sinks, random_binding=True)
+
+
+def _run_until(simulator, index):
+    # Stop between two events without finishing the sinks, as an interrupted run would
+    for event in simulator.iter_events():
+        if event.index == index:
+            break
+
+
+def test_resume_reproduces_uninterrupted_run():
+    reference = _RecordingSink()
+    expected = _simulator([reference]).run(max_steps=N_EVENTS)
+
+    simulator = _simulator([_RecordingSink()])
+    _run_until(simulator, CHECKPOINT_AT)
+    data = simulator.checkpoint()
+    # Whatever happens after the checkpoint is forgotten on restore
+    _run_until(simulator, CHECKPOINT_AT + 30)
+    resumed_sink = _RecordingSink()
+    resumed = Simulator.restore(data, simulator.cpn, _net()[2], sinks=[resumed_sink])
+    resumed.run(max_steps=N_EVENTS - CHECKPOINT_AT)
+    assert resumed_sink.events == reference.events[CHECKPOINT_AT:]
+    assert _tokens(resumed.marking) == _tokens(expected.marking)
+    assert resumed.clock == expected.clock
+
+
+def test_fork_continues_as_the_original():
+    simulator = _simulator([])
+    _run_until(simulator, CHECKPOINT_AT)
+    original, copy_, reseeded = _RecordingSink(), _RecordingSink(), _RecordingSink()
+    fork = simulator.fork(sinks=[copy_])
+    other = simulator.fork(sinks=[reseeded], seed=12)
+    simulator.add_sink(original)
+    for sim in (simulator, fork, other):
+        sim.run(max_steps=N_EVENTS - CHECKPOINT_AT)
+    assert copy_.events == original.events and len(original.events) == N_EVENTS - CHECKPOINT_AT
+    assert _tokens(fork.marking) == _tokens(simulator.marking)
+    # Another seed explores another future from the same prefix
+    assert reseeded.events != original.events
+
+
+def _csv_sink(directory, chunk_size):
+    return CSVSink(os.path.join(directory, "events.csv"), os.path.join(directory, "relations.csv"),
+                   os.path.join(directory, "objects.csv"), chunk_size=chunk_size)
+
+
+def _jsonlines_sink(directory, chunk_size):
+    return JSONLinesSink(os.path.join(directory, "events.jsonl"), os.path.join(directory, "objects.jsonl"),
+                         chunk_size=chunk_size)
+
+
+def _parquet_sink(directory, chunk_size):
+    pytest.importorskip("pyarrow")
+    return ParquetSink(os.path.join(directory, "events"), os.path.join(directory, "relations"),
+                       os.path.join(directory, "objects.parquet"), chunk_size=chunk_size)
+
+
+def _read_outputs(directory):
+    if os.path.exists(os.path.join(directory, "objects.parquet")):
+        pd = pytest.importorskip("pandas")
+        return [pd.read_parquet(os.path.join(directory, name)).to_dict("list")
+                for name in ("events", "relations", "objects.parquet")]
+    outputs = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+@pytest.mark.parametrize("make_sink", [_csv_sink, _jsonlines_sink, _parquet_sink])
+def test_chunked_sink_resume_reproduces_uninterrupted_output(make_sink, tmp_path):
+    full, resumed = str(tmp_path / "full"), str(tmp_path / "resumed")
+    os.makedirs(full)
+    os.makedirs(resumed)
+    _simulator([make_sink(full, 7)]).run(max_steps=N_EVENTS)
+
+    simulator = _simulator([make_sink(resumed, 7)])
+    _run_until(simulator, CHECKPOINT_AT)
+    data = simulator.checkpoint()
+    # Chunks written after the checkpoint are cut off on restore
+    _run_until(simulator, CHECKPOINT_AT + 30)
+    simulator.sinks[0].flush()
+    restored = Simulator.restore(data, simulator.cpn, _net()[2], sinks=[make_sink(resumed, 7)])
+    restored.run(max_steps=N_EVENTS - CHECKPOINT_AT)
+    assert _read_outputs(resumed) == _read_outputs(full)
+
+
+def _event_rows(directory):
+    # Events (eid, activity, timestamp) and relations (eid, oid, type) written, whatever the format
+    if os.path.exists(os.path.join(directory, "objects.parquet")):
+        events, relations, _ = _read_outputs(directory)
+        return (list(zip(events["ocel:eid"], events["ocel:activity"], events["ocel:timestamp"])),
+                sorted(zip(relations["ocel:eid"], relations["ocel:oid"], relations["ocel:type"])))
+    if os.path.exists(os.path.join(directory, "events.jsonl")):
+        with open(os.path.join(directory, "events.jsonl"), encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        return ([(r["ocel:eid"], r["ocel:activity"], r["ocel:timestamp"]) for r in records],
+                sorted((r["ocel:eid"], o["ocel:oid"], o["ocel:type"]) for r in records for o in r["ocel:omap"]))
+    with open(os.path.join(directory, "events.csv"), newline="", encoding="utf-8") as f:
+        events = [tuple(row) for row in csv.reader(f)][1:]
+    with open(os.path.join(directory, "relations.csv"), newline="", encoding="utf-8") as f:
+        relations = sorted((eid, oid, otype) for eid, _, _, oid, otype, _ in list(csv.reader(f))[1:])
+    return events, relations
+
+
+@pytest.mark.parametrize("make_sink", [_csv_sink, _jsonlines_sink, _parquet_sink])
+def test_chunked_sink_fork_reproduces_uninterrupted_output(make_sink, tmp_path):
+    full, forked = str(tmp_path / "full"), str(tmp_path / "forked")
+    os.makedirs(full)
+    os.makedirs(forked)
+    _simulator([make_sink(full, 7)]).run(max_steps=N_EVENTS)
+
+    # The fork writes its own files, from the fork point on
+    simulator = _simulator([])
+    _run_until(simulator, CHECKPOINT_AT)
+    simulator.fork(sinks=[make_sink(forked, 7)]).run(max_steps=N_EVENTS - CHECKPOINT_AT)
+    events, relations = _event_rows(full)
+    after = {eid for eid, _, _ in events[CHECKPOINT_AT:]}
+    assert _event_rows(forked) == (events[CHECKPOINT_AT:], [r for r in relations if r[0] in after])
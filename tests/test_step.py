@@ -0,0 +1,110 @@
+import copy
+import random
+
+import pytest
+
+from cpnpy.cpn.cpn_imp import *
+
+
+def _net():
+    colorsets = ColorSetParser().parse_definitions("colset INT = int timed;")
+    p, q, r = (Place(name, colorsets["INT"]) for name in ("p", "q", "r"))
+    cpn = CPN()
+    for place in (p, q, r):
+        cpn.add_place(place)
+    transitions = {name: Transition(name, variables=["x", "y"] if name == "J" else ["x"]) for name in "ABCJ"}
+    for t in transitions.values():
+        cpn.add_transition(t)
+    # A and C compete for the tokens of p, J joins a token of p with a token of q; outputs are delayed, so
+    # that no element of a step can consume what another one produces
+    cpn.add_arc(Arc(p, transitions["A"], "x"))
+    cpn.add_arc(Arc(transitions["A"], q, "x @+1"))
+    cpn.add_arc(Arc(q, transitions["B"], "x"))
+    cpn.add_arc(Arc(transitions["B"], p, "(x + 1) % 3 @+2"))
+    cpn.add_arc(Arc(p, transitions["C"], "x"))
+    cpn.add_arc(Arc(transitions["C"], r, "x @+1"))
+    cpn.add_arc(Arc(p, transitions["J"], "x"))
+    cpn.add_arc(Arc(q, transitions["J"], "y"))
+    cpn.add_arc(Arc(transitions["J"], r, "x + y @+3"))
+    marking = Marking()
+    marking.set_tokens("p", [0, 1, 1, 2], [0, 0, 1, 4])
+    marking.set_tokens("q", [1, 2], [0, 0])
+    marking.global_clock = 1
+    return cpn, transitions, marking
+
+
+def _tokens(marking):
+    return {place: sorted((t.value, t.timestamp) for t in ms.tokens)
+            for place, ms in marking._marking.items() if len(ms)}
+
+
+def _demand(cpn, context, step):
+    # Ready tokens consumed by the elements of a step, per (place, value)
+    demand = {}
+    for t, binding in step:
+        for arc in cpn.get_input_arcs(t):
+            for v in context.evaluate_arc(arc.expression, binding)[0]:
+                demand[(arc.source.name, v)] = demand.get((arc.source.name, v), 0) + 1
+    return demand
+
+
+def test_step_fits_and_is_maximal():
+    context = EvaluationContext()
+    rng = random.Random(0)
+    for _ in range(30):
+        cpn, _, marking = _net()
+        step = cpn.find_step(marking, context, rng=rng)
+        assert step
+        remaining = {(place_name, value): n for place_name, ms in marking._marking.items()
+                     for value, n in ms.ready_values(marking.global_clock)}
+        for key, needed in _demand(cpn, context, step).items():
+            remaining[key] = remaining.get(key, 0) - needed
+        assert all(n >= 0 for n in remaining.values())
+        # No enabled binding element fits in the tokens the step leaves
+        for t in cpn.transitions:
+            for binding in cpn.iter_bindings(t, marking, context):
+                demand = _demand(cpn, context, [(t, binding)])
+                assert any(remaining.get(key, 0) < needed for key, needed in demand.items())
+
+
+def test_conflicting_elements_share_the_tokens():
+    context = EvaluationContext()
+    cpn, transitions, marking = _net()
+    marking.set_tokens("p", [1])
+    marking.set_tokens("q", [])
+    # A and C both want the single token of p: only one of them is in the step
+    step = cpn.find_step(marking, context)
+    assert len(step) == 1 and step[0][1] == {"x": 1}
+    # With two tokens, both conflicting elements (or one twice) fit
+    marking.set_tokens("p", [1, 1])
+    step = cpn.find_step(marking, context, rng=random.Random(3))
+    assert len(step) == 2
+    # Seeds are tried first
+    step = cpn.find_step(marking, context, seeds=[(transitions["C"], {"x": 1})])
+    assert step[0][0] is transitions["C"]
+
+
+def test_fire_step_equals_sequential_firing():
+    context = EvaluationContext()
+    rng = random.Random(1)
+    for _ in range(30):
+        cpn, _, marking = _net()
+        step = cpn.find_step(marking, context, rng=rng)
+        expected = copy.deepcopy(marking)
+        order = list(step)
+        rng.shuffle(order)
+        for t, binding in order:
+            cpn.fire_transition(t, expected, context, binding)
+        occurrences = cpn.fire_step(step, marking, context)
+        assert _tokens(marking) == _tokens(expected)
+        assert [o.transition for o in occurrences] == [t for t, _ in step]
+
+
+def test_fire_step_rejects_overlapping_demand():
+    context = EvaluationContext()
+    cpn, transitions, marking = _net()
+    before = _tokens(marking)
+    # Only one token 0 is ready in p
+    with pytest.raises(RuntimeError):
+        cpn.fire_step([(transitions["A"], {"x": 0}), (transitions["C"], {"x": 0})], marking, context)
+    assert _tokens(marking) == before
@@ -0,0 +1,106 @@
+import json
+import os
+from collections import deque
+
+from cpnpy.analysis import sweepline
+from cpnpy.analysis.analyzer import StateSpaceAnalyzer
+from cpnpy.analysis.reachability import build_state_store, copy_marking, equiv_marking_to_key, iter_successors
+from cpnpy.analysis.sweepline import sweep_line_explore
+from cpnpy.cpn.cpn_imp import *
+from cpnpy.cpn.importer import import_cpn_from_json
+
+FILES = os.path.join(os.path.dirname(__file__), "..", "files")
+
+
+def _load(folder, name):
+    with open(os.path.join(FILES, folder, name + ".json")) as f:
+        return import_cpn_from_json(json.load(f))
+
+
+def _timed_net():
+    colorsets = ColorSetParser().parse_definitions("colset INT = int timed;")
+    p1, p2 = Place("P1", colorsets["INT"]), Place("P2", colorsets["INT"])
+    t = Transition("T", variables=["x"])
+    u = Transition("U", variables=["y"], guard="y < 5")
+    cpn = CPN()
+    cpn.add_place(p1)
+    cpn.add_place(p2)
+    cpn.add_transition(t)
+    cpn.add_transition(u)
+    cpn.add_arc(Arc(p1, t, "x"))
+    cpn.add_arc(Arc(t, p2, "x @+2"))
+    cpn.add_arc(Arc(p2, u, "y"))
+    cpn.add_arc(Arc(u, p1, "y + 1"))
+    marking = Marking()
+    marking.set_tokens("P1", [0, 1, 1, 2, 3])
+    return cpn, marking, EvaluationContext()
+
+
+def _explore_up_to(cpn, marking, context, max_clock):
+    # Reference: breadth-first search of the states with a clock <= max_clock
+    init = copy_marking(marking)
+    seen = {equiv_marking_to_key(init)}
+    queue = deque([init])
+    n_arcs = n_cut = 0
+    while queue:
+        for _, _, successor in iter_successors(cpn, queue.popleft(), context):
+            if successor.global_clock > max_clock:
+                n_cut += 1
+                continue
+            n_arcs += 1
+            key = equiv_marking_to_key(successor)
+            if key not in seen:
+                seen.add(key)
+                queue.append(successor)
+    return len(seen), n_arcs, n_cut
+
+
+def test_sweep_line_matches_full_exploration():
+    for cpn, marking, context in (_timed_net(), _load("bigger_cpns", "electronic_manufacturing")):
+        result = sweep_line_explore(cpn, marking, context)
+        store = build_state_store(cpn, marking, context)
+        analyzer = StateSpaceAnalyzer(cpn, marking, context)
+        assert result.complete and result.frontier == [] and result.n_cut_arcs == 0
+        assert result.n_states == len(store)
+        assert result.n_arcs == store.number_of_edges()
+        assert {equiv_marking_to_key(m) for m in result.list_dead_markings()} == set(analyzer.list_dead_markings())
+        assert result.get_place_bounds() == analyzer.get_place_bounds()
+        # Only part of the state space is held at once
+        assert result.peak_stored_states <= result.n_states
+
+
+def test_max_clock_cut_is_recorded():
+    # ex5 has an infinite state space, with a growing clock
+    cpn, marking, context = _load("minimal_cpns", "ex5")
+    result = sweep_line_explore(cpn, marking, context, max_clock=20)
+    n_states, n_arcs, n_cut = _explore_up_to(cpn, marking, context, 20)
+    assert result.termination == "max_clock" and not result.complete
+    assert (result.n_states, result.n_arcs, result.n_cut_arcs) == (n_states, n_arcs, n_cut)
+    assert result.frontier and result.list_unexplored_markings() == result.frontier
+    assert all(m.global_clock <= 20 for m in result.frontier)
+    assert result.get_statistics()["cut_arcs"] == n_cut
+
+
+def test_time_budget_leaves_a_frontier():
+    cpn, marking, context = _load("minimal_cpns", "ex5")
+    result = sweep_line_explore(cpn, marking, context, time_budget=0)
+    assert result.termination == "time_budget" and not result.complete
+    assert [equiv_marking_to_key(m) for m in result.frontier] == [equiv_marking_to_key(marking)]
+
+
+def test_interning_tables_are_compacted(monkeypatch):
+    sizes = []
+    compact = sweepline._compact
+
+    def spy(encoder, layers):
+        fresh = compact(encoder, layers)
+        sizes.append((encoder.interned_size(), fresh.interned_size()))
+        return fresh
+
+    monkeypatch.setattr(sweepline, "_compact", spy)
+    cpn, marking, context = _load("minimal_cpns", "ex5")
+    result = sweep_line_explore(cpn, marking, context, max_clock=3000)
+    assert sizes
+    # The tables only keep what the stored layers use, whatever the number of clock values seen
+    assert all(after < 100 <= before for before, after in sizes)
+    assert (result.n_states, result.n_arcs, result.n_cut_arcs) == _explore_up_to(cpn, marking, context, 3000)